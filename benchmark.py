@@ -0,0 +1,324 @@
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from charts import facebook_chart, tweets_chart, youtube_chart
+from communities import louvain
+from data_loader import read_dataset
+from layout import compute_layout
+from links import canonical_links, link_index
+import networks
+from networks import DEFAULT_LAYOUT, NETWORK_STYLES, build_share_graph, create_links_network, create_network
+from polarization import incidence_matrix, mixing_metrics, stance_codes, tie_mixing, weighted_mixing
+from story_stats import aggregate, summarize
+from studies import DEFAULT_STUDY, study_config
+from time_index import build_time_index, window_timeline, window_totals
+from timeline import stance_timeline, youtube_posts
+
+
+DEFAULT_SIZES = [300, 10_000, 100_000]
+
+# largest input each stage is run at, beyond that it is recorded as skipped
+STAGE_LIMITS = {
+	'cold_imports': None,
+	'load_tweets_csv': None,
+	'load_facebook_csv': None,
+	'load_youtube_csv': None,
+	'timeline_twitter': None,
+	'timeline_facebook': None,
+	'timeline_youtube': None,
+	'time_index_twitter': None,
+	'window_queries': None,
+	'story_stats': None,
+	'canonical_links': None,
+	'story_join': None,
+	'graph_nytimes': None,
+	'graph_full_links': None,
+	'louvain': 1_000_000,
+	'polarization_weighted': None,
+	'polarization_ties': 1_000_000,
+	'layout': 20_000,
+	'pyvis_nytimes': None,
+	'pyvis_full_links': None,
+	'chart_twitter': None,
+	'chart_facebook': None,
+	'chart_youtube': None,
+}
+
+STANCES = np.array(['misleading', 'nuanced_accurate', 'neutral'])
+STANCE_WEIGHTS = [0.7, 0.28, 0.02]
+
+
+def _days(rng, n):
+	start = pd.Timestamp('2023-01-29').value
+	end = pd.Timestamp('2023-04-01').value
+	return pd.to_datetime(rng.integers(start, end, n))
+
+
+def _heavy_tailed(rng, n, scale):
+	# engagement is concentrated in a few posts, as in the real exports
+	return (rng.pareto(1.2, n) * scale).astype('int64')
+
+
+def synthetic_tweets(n, seed=0):
+	rng = np.random.default_rng(seed)
+	users = max(n // 4, 1)
+	links = max(n // 50, 1)
+	usernames = 'user' + pd.Series(rng.zipf(1.5, n) % users).astype(str)
+	tweet_ids = pd.Series(rng.integers(10 ** 18, 2 * 10 ** 18, n)).astype(str)
+	return pd.DataFrame({
+		'username': usernames,
+		'original_link': 'https://news.example.com/story/' + pd.Series(rng.zipf(1.3, n) % links).astype(str),
+		'tweet_id': tweet_ids,
+		'retweets': _heavy_tailed(rng, n, 20),
+		'impressions': _heavy_tailed(rng, n, 2000),
+		'day': _days(rng, n),
+		'link': 'https://twitter.com/' + usernames + '/status/' + tweet_ids,
+		'stance': rng.choice(STANCES, n, p=STANCE_WEIGHTS),
+		'notes': np.where(rng.random(n) < 0.05, 'not relevant', None),
+	})
+
+
+def synthetic_account_stances(tweets, seed=0):
+	rng = np.random.default_rng(seed)
+	usernames = tweets['username'].unique()
+	return pd.DataFrame({'username': usernames, 'accuracy_ratio': rng.choice(STANCES, len(usernames), p=STANCE_WEIGHTS)})
+
+
+def synthetic_facebook(n, seed=0):
+	rng = np.random.default_rng(seed)
+	return pd.DataFrame({
+		'day': _days(rng, n),
+		'link': 'https://www.facebook.com/' + pd.Series(rng.integers(0, 10 ** 12, n)).astype(str),
+		'name': 'page' + pd.Series(rng.integers(0, max(n // 10, 1), n)).astype(str),
+		'interactions': _heavy_tailed(rng, n, 100),
+		'stance': rng.choice(STANCES, n, p=STANCE_WEIGHTS),
+	})
+
+
+def synthetic_youtube(n, seed=0):
+	rng = np.random.default_rng(seed)
+	video_ids = pd.Series(rng.integers(0, 10 ** 12, n)).astype(str)
+	return pd.DataFrame({
+		'channelTitle': 'channel' + pd.Series(rng.integers(0, max(n // 5, 1), n)).astype(str),
+		'videoId': video_ids,
+		'link': 'https://www.youtube.com/watch?v=' + video_ids,
+		'publishedAt': _days(rng, n).strftime('%Y-%m-%dT%H:%M:%SZ'),
+		'videoTitle': 'video about the cochrane review ' + video_ids,
+		'videoDescription': 'a longer free text description of the video that mentions masks and cochrane ' + video_ids,
+		'videoCategoryLabel': 'News & Politics',
+		'viewCount': _heavy_tailed(rng, n, 5000),
+		'commentCount': _heavy_tailed(rng, n, 50),
+		'stance': rng.choice(STANCES, n, p=STANCE_WEIGHTS),
+	})
+
+
+def _pyvis_page(build, name, *frames):
+	# browser layout and a throwaway artifact cache, so every run pays for
+	# community detection and serialization only
+	style = dict(NETWORK_STYLES[name], layout=dict(DEFAULT_LAYOUT, mode='browser'))
+	cache_dir = networks.CACHE_DIR
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		networks.CACHE_DIR = tmp_dir
+		try:
+			return build(*frames, style=style).generate_html()
+		finally:
+			networks.CACHE_DIR = cache_dir
+
+
+def _story_stats(timeline):
+	config = study_config(DEFAULT_STUDY)
+	return summarize(aggregate(timeline, ['retweets', 'impressions'], config['events'], config['outlets']), config['events'], config['outlets'])
+
+
+def _polarization(tweets, color_code, mixing):
+	incidence, users, _ = incidence_matrix(tweets['username'].to_numpy(), tweets['original_link'].to_numpy())
+	return mixing_metrics(mixing(incidence, stance_codes(users, color_code)))
+
+
+def _story_join(tweets, facebook, seed=0):
+	# facebook posts of the same stories, shared without the scheme and with tracking parameters
+	rng = np.random.default_rng(seed)
+	stories = tweets['original_link'].to_numpy()[rng.integers(0, len(tweets), len(facebook))]
+	shared = pd.Series(stories).str.replace('https://', '', regex=False) + np.where(rng.random(len(facebook)) < 0.3, '/?utm_source=facebook', '')
+	posts = facebook.assign(link=shared.to_numpy())
+	twitter = link_index(tweets, 'original_link', ['retweets', 'impressions']).add_prefix('twitter_')
+	return pd.concat([twitter, link_index(posts, 'link', ['interactions']).add_prefix('facebook_')], axis=1, join='outer')
+
+
+def _cold_imports():
+	# what a fresh worker pays before the story's header is sent: its own modules and
+	# streamlit, with networkx, pyvis, louvain, scipy, matplotlib and altair left to the builders
+	subprocess.run([sys.executable, '-c', 'import streamlit, charts, concentration, ingest, links, networks, polarization, story_stats, time_index'],
+		cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+
+def _window_queries(timeline, index, queries=100):
+	# what scrubbing the date range does: totals of a window and the chart rows inside it
+	days = pd.date_range('2023-01-29', '2023-04-01', periods=queries)
+	for start, end in zip(days[:-1], days[1:] + pd.Timedelta(days=7)):
+		window_totals(index, start, end)
+		window_timeline(timeline, index, start, end)
+
+
+def _measure(func, memory):
+	start = time.perf_counter()
+	func()
+	seconds = time.perf_counter() - start
+
+	peak = None
+	if memory:
+		# second run so the tracing overhead does not distort the timing
+		tracemalloc.start()
+		func()
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+
+	return seconds, peak
+
+
+def stages(n, work_dir, seed=0):
+	# every stage comes with the setup of its inputs, run only when the stage is, and the inputs
+	# are cached for the stages after it, so filtered and skipped stages build and write nothing
+	@functools.cache
+	def tweets():
+		return synthetic_tweets(n, seed)
+
+	@functools.cache
+	def color_code():
+		return synthetic_account_stances(tweets(), seed)
+
+	@functools.cache
+	def facebook():
+		return synthetic_facebook(n, seed)
+
+	@functools.cache
+	def youtube():
+		return synthetic_youtube(n, seed)
+
+	@functools.cache
+	def csv(name):
+		path = os.path.join(work_dir, f'{name}_{n}.csv')
+		{'tweets': tweets, 'facebook_posts': facebook, 'youtube': youtube}[name]().to_csv(path, index=False)
+		return path
+
+	@functools.cache
+	def loaded_youtube():
+		return read_dataset(csv('youtube'), 'youtube')
+
+	@functools.cache
+	def twitter_timeline():
+		return stance_timeline(tweets(), 'twitter')
+
+	@functools.cache
+	def nytimes():
+		return tweets().rename(columns={'link': 'tweet'})
+
+	@functools.cache
+	def graph():
+		return build_share_graph(nytimes(), tweet_column='tweet')[0]
+
+	yield 'cold_imports', lambda: (), _cold_imports
+	yield 'load_tweets_csv', lambda: (csv('tweets'),), lambda path: read_dataset(path, 'tweets')
+	yield 'load_facebook_csv', lambda: (csv('facebook_posts'),), lambda path: read_dataset(path, 'facebook_posts')
+	yield 'load_youtube_csv', lambda: (csv('youtube'),), lambda path: read_dataset(path, 'youtube')
+	yield 'timeline_twitter', lambda: (tweets(),), lambda tweets: stance_timeline(tweets, 'twitter')
+	yield 'timeline_facebook', lambda: (facebook(),), lambda facebook: stance_timeline(facebook, 'facebook')
+	yield 'timeline_youtube', lambda: (loaded_youtube(),), lambda youtube: stance_timeline(youtube_posts(youtube), 'youtube')
+	yield 'time_index_twitter', lambda: (twitter_timeline(),), lambda timeline: build_time_index(timeline, ['retweets', 'impressions'])
+	yield 'window_queries', lambda: (twitter_timeline(),), lambda timeline: _window_queries(timeline, build_time_index(timeline, ['retweets', 'impressions']))
+	yield 'story_stats', lambda: (twitter_timeline(),), _story_stats
+	yield 'canonical_links', lambda: (tweets(),), lambda tweets: canonical_links(tweets['original_link'])
+	yield 'story_join', lambda: (tweets(), facebook()), lambda tweets, facebook: _story_join(tweets, facebook, seed)
+	yield 'graph_nytimes', lambda: (nytimes(),), lambda nytimes: build_share_graph(nytimes, tweet_column='tweet')
+	yield 'graph_full_links', lambda: (tweets(),), lambda tweets: build_share_graph(tweets, tweet_column='link', directed=True)
+	yield 'polarization_weighted', lambda: (tweets(), color_code()), lambda tweets, color_code: _polarization(tweets, color_code, weighted_mixing)
+	yield 'polarization_ties', lambda: (tweets(), color_code()), lambda tweets, color_code: _polarization(tweets, color_code, tie_mixing)
+	yield 'louvain', lambda: (graph(),), louvain
+	yield 'layout', lambda: (graph(),), compute_layout
+	yield 'pyvis_nytimes', lambda: (nytimes(),), lambda nytimes: _pyvis_page(create_network, 'nytimes', nytimes)
+	yield 'pyvis_full_links', lambda: (tweets(), color_code()), lambda tweets, color_code: _pyvis_page(create_links_network, 'full_links', tweets, color_code)
+	yield 'chart_twitter', lambda: (tweets(),), lambda tweets: tweets_chart(stance_timeline(tweets, 'twitter'), 'retweets_cumulative').to_json()
+	yield 'chart_facebook', lambda: (facebook(),), lambda facebook: facebook_chart(stance_timeline(facebook, 'facebook')).to_json()
+	yield 'chart_youtube', lambda: (loaded_youtube(),), lambda youtube: youtube_chart(stance_timeline(youtube_posts(youtube), 'youtube')).to_json()
+
+
+def run(sizes, memory=True, seed=0, only=None):
+	results = []
+	with tempfile.TemporaryDirectory() as work_dir:
+		for n in sizes:
+			for stage, setup, func in stages(n, work_dir, seed):
+				if only and stage not in only:
+					continue
+
+				limit = STAGE_LIMITS[stage]
+				if limit is not None and n > limit:
+					results.append({'stage': stage, 'rows': n, 'skipped': True})
+					continue
+
+				inputs = setup()
+				seconds, peak = _measure(lambda: func(*inputs), memory)
+				results.append({'stage': stage, 'rows': n, 'seconds': round(seconds, 6), 'peak_bytes': peak})
+				peak_mb = '' if peak is None else f'{peak / 2 ** 20:10.1f} MB'
+				print(f'{stage:20} {n:>10} {seconds:10.3f} s {peak_mb}', flush=True)
+
+	return results
+
+
+def compare(results, baseline, tolerance):
+	previous = {(r['stage'], r['rows']): r for r in baseline['results'] if not r.get('skipped')}
+	regressions = []
+	for result in results:
+		before = previous.get((result['stage'], result['rows']))
+		if result.get('skipped') or before is None or before['seconds'] == 0:
+			continue
+		ratio = result['seconds'] / before['seconds']
+		if ratio > tolerance:
+			regressions.append(f"{result['stage']} at {result['rows']} rows: {before['seconds']:.3f}s -> {result['seconds']:.3f}s ({ratio:.2f}x)")
+	return regressions
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Time and measure the peak memory of every stage of the story pipeline on synthetic data.')
+	parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help='rows per synthetic dataset, e.g. 300 10000 1000000 10000000')
+	parser.add_argument('--stages', nargs='+', default=None, help=f'subset of stages to run, from {", ".join(STAGE_LIMITS)}')
+	parser.add_argument('--out', default='benchmark_results.json')
+	parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--compare', default=None, help='previous results file, exits non-zero on regressions')
+	parser.add_argument('--tolerance', type=float, default=1.5, help='slowdown ratio counted as a regression')
+	args = parser.parse_args()
+
+	unknown = [stage for stage in args.stages or [] if stage not in STAGE_LIMITS]
+	if unknown:
+		parser.error(f'unknown stage: {", ".join(unknown)}')
+
+	results = run(args.sizes, memory=not args.no_memory, seed=args.seed, only=args.stages)
+	report = {
+		'python': sys.version.split()[0],
+		'platform': platform.platform(),
+		'pandas': pd.__version__,
+		'numpy': np.__version__,
+		'sizes': args.sizes,
+		'results': results,
+	}
+	with open(args.out, 'w', encoding='utf-8') as f:
+		json.dump(report, f, indent=2)
+	print(f'results written to {args.out}')
+
+	if args.compare:
+		with open(args.compare, 'r', encoding='utf-8') as f:
+			regressions = compare(results, json.load(f), args.tolerance)
+		for regression in regressions:
+			print(f'regression: {regression}')
+		sys.exit(1 if regressions else 0)
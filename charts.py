@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from studies import DEFAULT_STUDY, STANCE_COLORS, study_config
+from time_index import dataset_time_index, window_timeline
+from timeline import dataset_timeline, downsample_timeline
+
+
+# columns the twitter charts and their stance filter read
+TWEET_CHART_COLUMNS = ['day', 'link', 'retweets', 'impressions', 'stance', 'notes']
+YOUTUBE_CHART_COLUMNS = ['publishedAt', 'link', 'channelTitle', 'viewCount', 'stance']
+
+# above this many posts the charts send aggregated lines and the top posts of each bucket instead of every row
+MAX_CHART_POINTS = 2000
+
+
+def select_size(y_axis):
+	if y_axis == "retweets_cumulative":
+		return "retweets"
+	else:
+		return "impressions"
+
+
+def stance_chart(combined_df, y_axis, size, tooltip, y_title=None, stances=None):
+	# altair is only imported once a chart is built, not when the story starts
+	import altair as alt
+
+	stances = study_config(DEFAULT_STUDY)['stances'] if stances is None else stances
+	color_scale = alt.Scale(
+		domain=list(stances.values()),
+		range=[STANCE_COLORS[stance] for stance in stances]
+	)
+	color = alt.Color('label:N', scale=color_scale, legend=alt.Legend(title="Stances"))
+	y = alt.Y(f'{y_axis}:Q', axis=alt.Axis(title=y_title)) if y_title else f'{y_axis}:Q'
+
+	# only ship the columns the chart encodes
+	fields = [field.split(':')[0] for field in tooltip]
+	columns = list(dict.fromkeys(['day', 'label', 'link', y_axis, size] + fields))
+
+	if len(combined_df) <= MAX_CHART_POINTS:
+		points = combined_df[columns]
+		line = None
+	else:
+		points, line = downsample_timeline(combined_df, size)
+		points = points[columns]
+		line = line[['day', 'label', y_axis, 'posts']]
+
+	# Create the combined chart
+	combined_chart = alt.Chart(points).mark_circle().encode(
+		x="day:T",
+		y=y,
+		size=alt.Size(f'{size}:Q', legend=None),
+		tooltip=tooltip,
+		href='link',
+		color=color
+	)
+
+	if line is not None:
+		line_chart = alt.Chart(line).mark_line().encode(
+			x="day:T",
+			y=y,
+			tooltip=['label:N', 'day:T', f'{y_axis}:Q', 'posts:Q'],
+			color=color
+		)
+		combined_chart = alt.layer(line_chart, combined_chart)
+
+	combined_chart = combined_chart.properties(width=1200, height=700).interactive()
+
+	combined_chart['usermeta'] = {
+		"embedOptions": {
+			'loader': {'target': '_blank'}
+		}
+	}
+
+	return combined_chart
+
+
+@timed()
+def tweets_chart(combined_df, y_axis, stances=None):
+	size = select_size(y_axis)
+	return stance_chart(combined_df, y_axis, size, ['link:N', f'{size}:Q', 'day:T'], y_title=y_axis.capitalize(), stances=stances)
+
+
+@timed()
+def youtube_chart(combined_df, stances=None):
+	return stance_chart(combined_df, "views_cumulative", "views", ['channel_title:N', 'link:N', "views:Q", 'day:T'], stances=stances)
+
+
+@timed()
+def facebook_chart(combined_df, stances=None):
+	tooltip_list = ['link:N', "interactions:Q", 'day:T']
+
+	# Check if 'name' column exists in the DataFrame
+	if 'name' in combined_df.columns:
+		tooltip_list.insert(0, 'name:N')
+
+	return stance_chart(combined_df, "interactions_cumulative", "interactions", tooltip_list, stances=stances)
+
+
+def lorenz_chart(lorenz, share=None):
+	import altair as alt
+
+	# the curve is monotone, an evenly spaced subset of its points draws the same line
+	if len(lorenz) > MAX_CHART_POINTS:
+		lorenz = lorenz.iloc[np.unique(np.linspace(0, len(lorenz) - 1, MAX_CHART_POINTS).astype(int))]
+
+	x = alt.X('accounts:Q', axis=alt.Axis(format='%', title='Share of accounts, smallest first'))
+	y = alt.Y('engagement:Q', axis=alt.Axis(format='%', title='Share of engagement'))
+	curve = alt.Chart(lorenz).mark_line(color="#FF7F7F").encode(x=x, y=y)
+	equality = alt.Chart(pd.DataFrame({'accounts': [0, 1], 'engagement': [0, 1]})).mark_line(color='grey', strokeDash=[4, 4]).encode(x=x, y=y)
+	chart = equality + curve
+
+	if share is not None:
+		rule = alt.Chart(pd.DataFrame({'engagement': [1 - share]})).mark_rule(color='grey').encode(y='engagement:Q')
+		chart = chart + rule
+
+	return chart.properties(width=600, height=400)
+
+
+# chart name -> (dataset, platform, columns read, builder, keyword arguments), in story order
+STORY_CHARTS = {
+	'top_tweets_impressions': ('top_tweets', 'twitter', TWEET_CHART_COLUMNS, tweets_chart, {'y_axis': 'impressions_cumulative'}),
+	'top_tweets_retweets': ('top_tweets', 'twitter', TWEET_CHART_COLUMNS, tweets_chart, {'y_axis': 'retweets_cumulative'}),
+	'facebook_top_posts': ('facebook_top_posts', 'facebook', None, facebook_chart, {}),
+	'youtube': ('youtube', 'youtube', YOUTUBE_CHART_COLUMNS, youtube_chart, {}),
+	'news_stories_impressions': ('news_stories', 'twitter', TWEET_CHART_COLUMNS, tweets_chart, {'y_axis': 'impressions_cumulative'}),
+	'news_stories_retweets': ('news_stories', 'twitter', TWEET_CHART_COLUMNS, tweets_chart, {'y_axis': 'retweets_cumulative'}),
+	'news_stories_facebook': ('news_stories_facebook', 'facebook', None, facebook_chart, {}),
+}
+
+
+def study_charts(study=DEFAULT_STUDY):
+	# the story charts whose dataset and platform the study has
+	config = study_config(study)
+	return [name for name, (dataset, platform, *_) in STORY_CHARTS.items() if dataset in config['datasets'] and platform in config['platforms']]
+
+
+def story_chart(name, study=DEFAULT_STUDY, start=None, end=None):
+	dataset, platform, columns, builder, kwargs = STORY_CHARTS[name]
+	timeline = window_timeline(dataset_timeline(dataset, platform, columns, study), dataset_time_index(dataset, platform, columns, study), start, end)
+	return builder(timeline, stances=study_config(study)['stances'], **kwargs)
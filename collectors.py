@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+
+import pandas as pd
+
+from data_loader import DATASETS, SCHEMAS, load_dataset
+from ingest import POST_KEYS, POST_METRICS, ingest_batch, known_posts, read_batch, refresh_posts
+from instrumentation import stage
+from store import publish
+from studies import DEFAULT_STUDY, STUDIES, study_config, study_dir
+
+try:
+	import aiohttp
+except ImportError:
+	aiohttp = None
+
+
+# defaults of every collection, the command line overrides them per run: pages fetched at once,
+# pooled connections, rows per write to the dataset, retries of a failed page, first backoff in
+# seconds (doubled on every retry, with jitter) and the timeout of a page in seconds
+COLLECTOR_SETTINGS = {
+	'concurrency': 8,
+	'connections': 16,
+	'batch_size': 1000,
+	'retries': 3,
+	'backoff': 0.5,
+	'timeout': 30,
+}
+
+YOUTUBE_VIDEOS_URL = 'https://www.googleapis.com/youtube/v3/videos'
+# ids per videos.list request, the maximum the api accepts
+YOUTUBE_PAGE = 50
+
+# errors a page is fetched again after, besides 429 and 5xx responses
+RETRY_ERRORS = (OSError, asyncio.TimeoutError) + ((aiohttp.ClientError,) if aiohttp is not None else ())
+
+
+def fixtures_dir(study=DEFAULT_STUDY):
+	return os.path.join(study_dir(study), 'fixtures')
+
+
+def fixture_pages(name, study, options):
+	# every jsonl or csv export in <fixtures>/<dataset>/ is a page
+	folder = os.path.join(options.get('fixtures') or fixtures_dir(study), name)
+	if not os.path.isdir(folder):
+		return []
+	return sorted(entry.path for entry in os.scandir(folder) if entry.is_file() and entry.name.endswith(('.jsonl', '.csv')))
+
+
+async def fetch_fixture(session, page, name, options):
+	return await asyncio.to_thread(read_batch, page, DATASETS[name])
+
+
+def youtube_pages(name, study, options):
+	# the statistics of the videos already in the dataset, YOUTUBE_PAGE ids per request
+	if name != 'youtube':
+		raise ValueError(f'the youtube adapter refreshes the youtube dataset, not {name}')
+	ids = load_dataset(name, ['videoId'], study)['videoId'].dropna().unique().tolist()
+	return [ids[start:start + YOUTUBE_PAGE] for start in range(0, len(ids), YOUTUBE_PAGE)]
+
+
+async def fetch_youtube(session, page, name, options):
+	params = {'part': 'statistics', 'id': ','.join(page), 'maxResults': YOUTUBE_PAGE, 'key': options.get('api_key') or os.environ.get('YOUTUBE_API_KEY', '')}
+	async with session.get(options.get('url') or YOUTUBE_VIDEOS_URL, params=params) as response:
+		response.raise_for_status()
+		items = (await response.json())['items']
+	return pd.DataFrame({
+		'videoId': [item['id'] for item in items],
+		'viewCount': pd.array([int(item['statistics'].get('viewCount', 0)) for item in items], dtype='int64'),
+		# comments can be disabled, the count is then missing
+		'commentCount': pd.array([item['statistics'].get('commentCount') for item in items], dtype='Int64'),
+	})
+
+
+# adapter -> the pages of a collection, the coroutine fetching one page as rows of the dataset,
+# and whether it needs a pooled http session
+ADAPTERS = {
+	'fixture': {'pages': fixture_pages, 'fetch': fetch_fixture, 'http': False},
+	'youtube': {'pages': youtube_pages, 'fetch': fetch_youtube, 'http': True},
+}
+
+
+def _transient(error):
+	status = getattr(error, 'status', None)
+	return status is None or status == 429 or status >= 500
+
+
+async def _fetch(adapter, session, page, name, options, settings):
+	for attempt in range(settings['retries'] + 1):
+		try:
+			return await asyncio.wait_for(adapter['fetch'](session, page, name, options), settings['timeout'])
+		except RETRY_ERRORS as error:
+			if attempt == settings['retries'] or not _transient(error):
+				raise
+			await asyncio.sleep(settings['backoff'] * 2 ** attempt * (1 + random.random()))
+
+
+def _session(adapter, settings):
+	if not adapter['http']:
+		return contextlib.nullcontext()
+	if aiohttp is None:
+		raise ImportError('aiohttp is required by the http adapters')
+	connector = aiohttp.TCPConnector(limit=settings['connections'])
+	return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=settings['timeout']))
+
+
+async def collect(name, adapter='fixture', study=DEFAULT_STUDY, settings=None, **options):
+	# concurrency workers fetch the pages while a single writer streams their rows into the
+	# dataset in batches; the bounded queue between them holds back fetching when writes lag
+	settings = dict(COLLECTOR_SETTINGS, **(settings or {}))
+	adapter = ADAPTERS[adapter]
+	pages = asyncio.Queue()
+	for page in adapter['pages'](name, study, options):
+		pages.put_nowait(page)
+	results = asyncio.Queue(maxsize=2 * settings['concurrency'])
+	totals = {'pages': pages.qsize(), 'rows': 0, 'updated': 0, 'added': 0}
+
+	async def fetch_pages(session):
+		while not pages.empty():
+			page = pages.get_nowait()
+			await results.put(await _fetch(adapter, session, page, name, options, settings))
+
+	async def fetch_all(session):
+		# a failed page stops the other workers
+		fetchers = [asyncio.create_task(fetch_pages(session)) for _ in range(settings['concurrency'])]
+		try:
+			await asyncio.gather(*fetchers)
+		finally:
+			for fetcher in fetchers:
+				fetcher.cancel()
+		await results.put(None)
+
+	async def write_batches():
+		# new posts are appended batch by batch, while the metrics of posts already in the dataset
+		# are kept and replaced in a single rewrite of the csv once every page is in
+		pending, refreshed = [], []
+		while True:
+			rows = await results.get()
+			if rows is not None:
+				pending.append(rows)
+			if pending and (rows is None or sum(len(batch) for batch in pending) >= settings['batch_size']):
+				batch = pd.concat(pending, ignore_index=True)
+				known = await asyncio.to_thread(known_posts, name, batch, study)
+				refreshed.append(batch.loc[known, [column for column in (POST_KEYS[name], *POST_METRICS[name]) if column in batch.columns]])
+				if set(SCHEMAS[DATASETS[name]]['columns']) <= set(batch.columns):
+					totals['added'] += await asyncio.to_thread(ingest_batch, name, batch[~known], study)
+				totals['rows'] += len(batch)
+				pending = []
+			if rows is None:
+				if refreshed:
+					totals['updated'] = await asyncio.to_thread(refresh_posts, name, pd.concat(refreshed, ignore_index=True), study)
+				return
+
+	with stage('collect', dataset=name, study=study, pages=totals['pages']):
+		async with _session(adapter, settings) as session:
+			fetcher = asyncio.create_task(fetch_all(session))
+			writer = asyncio.create_task(write_batches())
+			try:
+				# whichever side fails first stops the other, a failed writer would otherwise leave
+				# the workers waiting on the full queue forever
+				done, _ = await asyncio.wait([fetcher, writer], return_when=asyncio.FIRST_EXCEPTION)
+				for task in done:
+					task.result()
+			finally:
+				fetcher.cancel()
+				writer.cancel()
+				await asyncio.gather(fetcher, writer, return_exceptions=True)
+	return totals
+
+
+def collect_dataset(name, adapter='fixture', study=DEFAULT_STUDY, settings=None, **options):
+	return asyncio.run(collect(name, adapter, study, settings, **options))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Collect new posts and refreshed metrics of a story dataset from a platform export.')
+	parser.add_argument('dataset', choices=list(POST_KEYS))
+	parser.add_argument('--adapter', default='fixture', choices=list(ADAPTERS))
+	parser.add_argument('--study', default=DEFAULT_STUDY, choices=list(STUDIES))
+	parser.add_argument('--fixtures', default=None, help="fixture directory of the fixture adapter (default: fixtures/ in the study's data directory)")
+	parser.add_argument('--url', default=None, help='endpoint of an http adapter, e.g. a local stand-in server')
+	parser.add_argument('--api-key', default=None, help='api key of an http adapter (default: YOUTUBE_API_KEY)')
+	for setting, value in COLLECTOR_SETTINGS.items():
+		parser.add_argument(f'--{setting.replace("_", "-")}', type=type(value), default=value)
+	parser.add_argument('--publish', action='store_true', help='publish a new version of the shared artifact store afterwards')
+	args = parser.parse_args()
+
+	if args.dataset not in study_config(args.study)['datasets']:
+		parser.error(f'unknown dataset: {args.dataset}')
+	settings = {setting: getattr(args, setting) for setting in COLLECTOR_SETTINGS}
+	totals = collect_dataset(args.dataset, args.adapter, args.study, settings, fixtures=args.fixtures, url=args.url, api_key=args.api_key)
+	print(f'{args.dataset}: {totals["pages"]} pages, {totals["rows"]} rows, {totals["updated"]} posts refreshed, {totals["added"]} new posts')
+
+	if args.publish:
+		print(f'published {publish(args.study)}')
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def warm_start_partition(G, previous):
+	# nodes seen before keep their community, new nodes start in one of their own
+	partition = {}
+	next_id = max(previous.values(), default=-1) + 1
+	for node in G.nodes:
+		if node in previous:
+			partition[node] = previous[node]
+		else:
+			partition[node] = next_id
+			next_id += 1
+	return partition
+
+
+def only_added_edges(G, previous_edges):
+	return all(G.has_edge(u, v) for u, v in previous_edges)
+
+
+def louvain(G, seed=0, initial=None):
+	import community as community_louvain
+
+	return community_louvain.best_partition(G, partition=initial, random_state=seed)
+
+
+def community_palette(n, base_colors=()):
+	# the story's own colours first, then tab20 and evenly spaced hues for anything beyond
+	import matplotlib.cm as cm
+	from matplotlib.colors import to_hex
+
+	colors = list(base_colors)[:n]
+	tab20 = [to_hex(cm.tab20(i)) for i in range(20)]
+	colors += [color for color in tab20 if color not in colors][:n - len(colors)]
+	if len(colors) < n:
+		hues = np.linspace(0, 1, n - len(colors), endpoint=False)
+		colors += [to_hex(cm.hsv(hue)) for hue in hues]
+	return colors
+
+
+def community_colors(partition, base_colors=()):
+	palette = community_palette(max(partition.values(), default=-1) + 1, base_colors)
+	return {node: palette[community_id] for node, community_id in partition.items()}
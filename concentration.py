@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from data_loader import dataset_hash, load_dataset
+from instrumentation import timed
+from studies import DEFAULT_STUDY, cached_build
+
+
+# dataset -> (account column, engagement column) the concentration is measured on
+ENGAGEMENT = {
+	'top_tweets': ('username', 'retweets'),
+	'tweets_stance': ('username', 'retweets'),
+	'nyt': ('username', 'retweets'),
+	'facebook_top_posts': ('name', 'interactions'),
+	'youtube': ('channelTitle', 'viewCount'),
+}
+
+# (study, dataset name) -> (content hash, concentration)
+_concentrations = OrderedDict()
+# key -> [lock, callers] of the builds in progress, see key_lock
+_building = {}
+_lock = threading.Lock()
+
+
+def account_totals(df, account, metric):
+	# engagement per account, largest first
+	codes, accounts = pd.factorize(df[account])
+	totals = np.bincount(codes[codes >= 0], weights=df[metric].to_numpy()[codes >= 0], minlength=len(accounts))
+	order = np.argsort(-totals, kind='stable')
+	return pd.Series(totals[order], index=accounts[order], name=metric)
+
+
+def lorenz_curve(totals):
+	# cumulative share of engagement against the cumulative share of accounts, smallest accounts first
+	values = np.sort(np.asarray(totals, dtype='float64'))
+	cumulative = np.concatenate([[0.0], np.cumsum(values)])
+	accounts = np.linspace(0, 1, len(cumulative))
+	return pd.DataFrame({'accounts': accounts, 'engagement': cumulative / cumulative[-1] if cumulative[-1] else cumulative})
+
+
+def gini(totals):
+	values = np.sort(np.asarray(totals, dtype='float64'))
+	n = len(values)
+	if n == 0 or values.sum() == 0:
+		return 0.0
+	return float((n + 1 - 2 * np.cumsum(values).sum() / values.sum()) / n)
+
+
+def covering_count(cumulative, target):
+	# number of accounts, largest first, whose cumulative engagement reaches target
+	if len(cumulative) == 0:
+		return 0
+	return min(int(np.searchsorted(cumulative, target, side='left')) + 1, len(cumulative))
+
+
+@timed()
+def dataset_concentration(name, study=DEFAULT_STUDY):
+	# sorted once per version of the data, any threshold afterwards is a binary search
+	digest = dataset_hash(name, study)
+
+	def build():
+		account, metric = ENGAGEMENT[name]
+		totals = account_totals(load_dataset(name, [account, metric], study), account, metric)
+		return {
+			'totals': totals,
+			'cumulative': np.cumsum(totals.to_numpy()),
+			'gini': gini(totals),
+			'lorenz': lorenz_curve(totals),
+		}
+
+	return cached_build(_concentrations, _building, _lock, (study, name), digest, build, 'concentrations')
+
+
+def covering_accounts(name, share, study=DEFAULT_STUDY):
+	concentration = dataset_concentration(name, study)
+	cumulative = concentration['cumulative']
+	return concentration['totals'].index[:covering_count(cumulative, share * cumulative[-1] if len(cumulative) else 0)]
+
+
+def concentration_summary(name, share, study=DEFAULT_STUDY):
+	concentration = dataset_concentration(name, study)
+	accounts = len(covering_accounts(name, share, study))
+	total = len(concentration['totals'])
+	return {
+		'accounts': total,
+		'covering_accounts': accounts,
+		'covering_share': accounts / total if total else 0.0,
+		'engagement': float(concentration['cumulative'][-1]) if total else 0.0,
+		'gini': concentration['gini'],
+	}
+
+
+def filter_dataset(name, share, columns=None, study=DEFAULT_STUDY):
+	# posts of the accounts that cover share of the engagement, the input of the filtered charts and networks
+	account = ENGAGEMENT[name][0]
+	read = None if columns is None else list(dict.fromkeys([*columns, account]))
+	df = load_dataset(name, read, study)
+	if share < 1:
+		df = df[df[account].isin(covering_accounts(name, share, study))]
+	return df if columns is None else df[list(columns)]
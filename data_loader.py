@@ -0,0 +1,408 @@
+import argparse
+import csv
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from instrumentation import stage
+from store import file_lock, store_table
+from studies import DEFAULT_STUDY, STUDIES, key_lock, lru_get, lru_put, study_config, study_dir
+
+try:
+	import pyarrow as pa
+	import pyarrow.ipc as ipc
+except ImportError:
+	pa = None
+
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+COLUMNAR_DIR = os.path.join(DATA_DIR, '.data_cache')
+
+STANCES = ['misleading', 'nuanced_accurate', 'neutral']
+
+# explicit schema for every kind of export used by the story
+SCHEMAS = {
+	'tweets': {
+		'columns': ['username', 'original_link', 'tweet_id', 'retweets', 'impressions', 'day', 'link', 'stance', 'notes'],
+		'dtypes': {'tweet_id': 'str', 'retweets': 'int64', 'impressions': 'int64'},
+		'dates': ['day'],
+		'categories': {'stance': STANCES},
+	},
+	'news_stories': {
+		'columns': ['day', 'unrefined_link', 'link', 'retweets', 'impressions', 'stance', 'notes'],
+		'dtypes': {'retweets': 'int64', 'impressions': 'int64'},
+		'dates': ['day'],
+		'categories': {'stance': STANCES},
+	},
+	'facebook_posts': {
+		'columns': ['day', 'link', 'name', 'interactions', 'stance'],
+		'dtypes': {'interactions': 'int64'},
+		'dates': ['day'],
+		'categories': {'stance': STANCES},
+	},
+	'facebook_links': {
+		'columns': ['day', 'link', 'stance', 'interactions'],
+		'dtypes': {'interactions': 'int64'},
+		'dates': ['day'],
+		'categories': {'stance': STANCES},
+	},
+	'youtube': {
+		'columns': ['channelTitle', 'videoId', 'link', 'publishedAt', 'videoTitle', 'videoDescription',
+			'videoCategoryLabel', 'viewCount', 'commentCount', 'stance'],
+		'dtypes': {'viewCount': 'int64', 'commentCount': 'Int64'},
+		'dates': ['publishedAt'],
+		'categories': {'stance': STANCES},
+	},
+	'account_stances': {
+		'columns': ['username', 'accuracy_ratio'],
+		'dtypes': {},
+		'dates': [],
+		'categories': {'accuracy_ratio': STANCES},
+	},
+	'link_tweets': {
+		'columns': ['username', 'original_link', 'link', 'retweets', 'stance'],
+		'dtypes': {'retweets': 'int64'},
+		'dates': [],
+		'categories': {'stance': STANCES},
+	},
+	'nytimes_tweets': {
+		'columns': ['username', 'retweets', 'tweet_id', 'original_link', 'tweet'],
+		'dtypes': {'retweets': 'int64', 'tweet_id': 'str'},
+		'dates': [],
+		'categories': {},
+	},
+}
+
+# dataset name -> schema, the csv file of each one is set per study
+DATASETS = {
+	'top_tweets': 'tweets',
+	'facebook_top_posts': 'facebook_posts',
+	'youtube': 'youtube',
+	'news_stories': 'news_stories',
+	'color_code': 'account_stances',
+	'tweets_stance': 'link_tweets',
+	'news_stories_facebook': 'facebook_links',
+	'nyt': 'nytimes_tweets',
+}
+
+# parsed frames are shared by every rerun and session of the worker process and evicted
+# least recently used first, keyed by (study, dataset name, columns) -> (content hash, frame)
+_cache = OrderedDict()
+# (study, dataset name) -> (file signature, content hash, sha256 state of the content, bytes hashed or
+# None if they did not end a line); appends update a copy of the state with their bytes instead of
+# hashing the file again
+_hashes = {}
+# (study, dataset name) -> (previous content hash, content hash, rows) of the last append seen, from
+# this process or another one; cached values of the previous content are extended with the rows
+_appends = {}
+# (study, dataset name, columns) -> [lock, callers] of the reads in progress, see key_lock
+_loading = {}
+_lock = threading.Lock()
+
+
+def dataset_path(name, study=DEFAULT_STUDY):
+	return os.path.join(study_dir(study), study_config(study)['datasets'][name])
+
+
+def columnar_path(name, study=DEFAULT_STUDY):
+	return os.path.join(COLUMNAR_DIR, study, name + '.arrow')
+
+
+def _file_signature(path):
+	stat = os.stat(path)
+	return (stat.st_mtime_ns, stat.st_size)
+
+
+def _file_hash(path, known=None):
+	# (sha256 state, bytes hashed or None, bytes after known or None). known is the (content hash, size)
+	# hashed before, when the file still starts with that content the bytes appended to it are kept
+	hasher = hashlib.sha256()
+	size, last, appended = 0, b'', None
+	with open(path, 'rb') as f:
+		if known is not None:
+			while size < known[1]:
+				block = f.read(min(1 << 20, known[1] - size))
+				if not block:
+					break
+				hasher.update(block)
+				size, last = size + len(block), block[-1:]
+			if size == known[1] and hasher.hexdigest() == known[0]:
+				appended = []
+
+		for block in iter(lambda: f.read(1 << 20), b''):
+			hasher.update(block)
+			size, last = size + len(block), block[-1:]
+			if appended is not None:
+				appended.append(block)
+
+	# a file that does not end a line may be in the middle of a write, its next change is hashed anew
+	if last != b'\n':
+		return hasher, None, None
+	return hasher, size, None if appended is None else b''.join(appended)
+
+
+def parse_dates(series):
+	# all exports are stored as naive UTC so they compare against plain date strings
+	return pd.to_datetime(series, utc=True, format='mixed').dt.tz_convert(None)
+
+
+def read_dataset(path, schema, columns=None):
+	columns = SCHEMAS[schema]['columns'] if columns is None else list(columns)
+	dtypes = {column: dtype for column, dtype in SCHEMAS[schema]['dtypes'].items() if column in columns}
+	df = pd.read_csv(path, usecols=columns, dtype=dtypes)
+	return apply_schema(df, schema, columns)
+
+
+def apply_schema(df, schema, columns=None):
+	schema = SCHEMAS[schema]
+	columns = schema['columns'] if columns is None else list(columns)
+	df = df[columns]
+
+	for column in schema['dates']:
+		if column in columns:
+			df[column] = parse_dates(df[column])
+
+	for column, categories in schema['categories'].items():
+		if column in columns:
+			df[column] = pd.Categorical(df[column], categories=categories)
+
+	return df
+
+
+def read_columnar(name, digest, columns=None, study=DEFAULT_STUDY):
+	path = columnar_path(name, study)
+	if pa is None or not os.path.exists(path):
+		return None
+
+	# the map stays open for as long as arrow buffers reference it, and only
+	# the pages of the selected columns are ever read
+	reader = ipc.open_file(pa.memory_map(path))
+	if reader.schema.metadata.get(b'source_hash') != digest.encode('ascii'):
+		return None
+
+	return table_frame(reader.read_all(), columns)
+
+
+def table_frame(table, columns=None):
+	# numeric and date columns stay read-only views of the arrow buffers and strings stay
+	# arrow-backed, so a frame of a memory-mapped table adds little to the heap
+	if columns is not None:
+		table = table.select(list(columns))
+	return table.to_pandas(split_blocks=True, types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+
+
+def dataset_table(name, study=DEFAULT_STUDY):
+	return pa.Table.from_pandas(read_dataset(dataset_path(name, study), DATASETS[name]), preserve_index=False)
+
+
+def convert_dataset(name, study=DEFAULT_STUDY):
+	if pa is None:
+		raise ImportError('pyarrow is required to write the columnar cache')
+
+	digest = dataset_hash(name, study)
+	table = dataset_table(name, study)
+	table = table.replace_schema_metadata({**table.schema.metadata, b'source_hash': digest.encode('ascii')})
+
+	path = columnar_path(name, study)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	tmp_path = f'{path}.{os.getpid()}.tmp'
+	# uncompressed so the file can be memory-mapped without decoding
+	with ipc.new_file(tmp_path, table.schema) as writer:
+		writer.write_table(table)
+	os.replace(tmp_path, path)
+	return path
+
+
+def dataset_hash(name, study=DEFAULT_STUDY):
+	path = dataset_path(name, study)
+	signature = _file_signature(path)
+
+	with _lock:
+		cached = _hashes.get((study, name))
+		if cached is not None and cached[0] == signature:
+			return cached[1]
+
+	# the mtime changed, the cached values stay valid if the content did not, and when rows were
+	# appended to it, by ingest or a collector in another process, only those rows are parsed
+	known = None if cached is None or cached[3] is None else (cached[1], cached[3])
+	hasher, size, appended = _file_hash(path, known)
+	digest = hasher.hexdigest()
+	rows = None
+	if appended and digest != cached[1]:
+		with open(path, 'rb') as f:
+			rows = read_dataset(io.BytesIO(f.readline() + appended), DATASETS[name])
+
+	with _lock:
+		_hashes[(study, name)] = (signature, digest, hasher, size)
+		if rows is not None:
+			_appends[(study, name)] = (cached[1], digest, rows)
+	return digest
+
+
+def appended_rows(name, previous, digest, study=DEFAULT_STUDY):
+	# the rows appended to the dataset from the previous content hash to digest, None unless that
+	# was the last append seen
+	with _lock:
+		append = _appends.get((study, name))
+	if append is None or append[:2] != (previous, digest):
+		return None
+	return append[2]
+
+
+def load_dataset(name, columns=None, study=DEFAULT_STUDY):
+	# the returned frame is shared, callers must not modify it in place
+	key = (study, name, None if columns is None else tuple(columns))
+
+	with stage('load_dataset', dataset=name, study=study) as record:
+		digest = dataset_hash(name, study)
+
+		with _lock:
+			cached = lru_get(_cache, key)
+		if cached is not None and cached[0] == digest:
+			record['source'] = 'memory'
+			return cached[1]
+
+		# read outside the lock, callers of other datasets are not held up by a parse
+		with key_lock(_loading, key, _lock):
+			with _lock:
+				cached = lru_get(_cache, key)
+			if cached is not None and cached[0] == digest:
+				record['source'] = 'memory'
+				return cached[1]
+
+			# a frame of the content before an append is extended, then the published store, shared
+			# by every worker on the host
+			rows = None if cached is None else appended_rows(name, cached[0], digest, study)
+			df = None if rows is None else pd.concat([cached[1], rows[list(cached[1].columns)]], ignore_index=True)
+			record['source'] = 'append'
+			if df is None:
+				table = store_table(name, digest, study)
+				df = None if table is None else table_frame(table, columns)
+				record['source'] = 'store'
+			if df is None:
+				df = read_columnar(name, digest, columns, study)
+				record['source'] = 'arrow'
+			if df is None:
+				df = read_dataset(dataset_path(name, study), DATASETS[name], columns)
+				record['source'] = 'csv'
+
+			with _lock:
+				lru_put(_cache, key, (digest, df), 'frames')
+			return df
+
+
+def dataset_lock(name, study=DEFAULT_STUDY):
+	# writers of a dataset csv, in this process or any other, take turns on an flock of <csv>.lock
+	return file_lock(dataset_path(name, study) + '.lock')
+
+
+def _csv_layout(path):
+	with open(path, 'rb') as f:
+		first_line = f.readline()
+		f.seek(0, os.SEEK_END)
+		f.seek(max(f.tell() - 1, 0))
+		last_byte = f.read(1)
+	header = next(csv.reader([first_line.decode('utf-8-sig')]))
+	return header, '\r\n' if first_line.endswith(b'\r\n') else '\n', last_byte == b'\n'
+
+
+def append_rows(name, rows, study=DEFAULT_STUDY):
+	# rows follow the dataset schema, they are written in the csv's own column
+	# order and line endings, and the cached values of the dataset are extended
+	# with them instead of built again, see appended_rows
+	path = dataset_path(name, study)
+
+	with dataset_lock(name, study):
+		previous = dataset_hash(name, study)
+		header, newline, terminated = _csv_layout(path)
+
+		text = rows.reindex(columns=header).to_csv(header=False, index=False, lineterminator=newline)
+		if not terminated:
+			text = newline + text
+
+		with _lock:
+			signature, known, hasher, size = _hashes.get((study, name), (None, None, None, None))
+			# the hash of the whole file, as any other process computes it: the state of the content
+			# hashed so far updated with the appended bytes, or the file hashed again if it changed since
+			unchanged = signature == _file_signature(path) and known == previous
+			if unchanged:
+				hasher = hasher.copy()
+				hasher.update(text.encode('utf-8'))
+			with open(path, 'a', encoding='utf-8', newline='') as f:
+				f.write(text)
+			signature = _file_signature(path)
+			if unchanged:
+				size = signature[1]
+			else:
+				hasher, size, _ = _file_hash(path)
+			digest = hasher.hexdigest()
+			_hashes[(study, name)] = (signature, digest, hasher, size)
+			if unchanged:
+				_appends[(study, name)] = (previous, digest, rows)
+			else:
+				_appends.pop((study, name), None)
+
+	return previous, digest
+
+
+def update_rows(name, key, rows, columns, study=DEFAULT_STUDY):
+	# replaces columns of the posts whose key is in rows. the csv is rewritten as text, so every
+	# other value keeps its formatting, and swapped in whole; cached frames of it are dropped.
+	# a rewrite costs the whole history, callers gather as many rows per call as they can
+	path = dataset_path(name, study)
+	rows = rows.drop_duplicates(key, keep='last')
+
+	with dataset_lock(name, study):
+		header, newline, terminated = _csv_layout(path)
+		df = pd.read_csv(path, dtype=str, keep_default_na=False)
+		positions = pd.Index(rows[key].astype(str)).get_indexer(df[key])
+		found = positions >= 0
+		if not found.any():
+			return 0
+
+		for column in columns:
+			values = rows[column].astype(object)
+			df.loc[found, column] = values.where(values.notna(), '').astype(str).to_numpy()[positions[found]]
+
+		text = df.to_csv(index=False, header=header, lineterminator=newline)
+		if not terminated:
+			text = text[:-len(newline)]
+		with open(f'{path}.{os.getpid()}.tmp', 'w', encoding='utf-8', newline='') as f:
+			f.write(text)
+		os.replace(f'{path}.{os.getpid()}.tmp', path)
+
+		content = text.encode('utf-8')
+		hasher = hashlib.sha256(content)
+		with _lock:
+			_hashes[(study, name)] = (_file_signature(path), hasher.hexdigest(), hasher, len(content) if content.endswith(b'\n') else None)
+			_appends.pop((study, name), None)
+			for cached in [cached for cached in _cache if cached[:2] == (study, name)]:
+				del _cache[cached]
+
+	return int(found.sum())
+
+
+def clear_cache():
+	with _lock:
+		_cache.clear()
+		_hashes.clear()
+		_appends.clear()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Write the typed columnar cache of the story datasets.')
+	parser.add_argument('datasets', nargs='*', help=f'datasets to convert, one of {", ".join(DATASETS)} (default: all of the study)')
+	parser.add_argument('--study', default=DEFAULT_STUDY, choices=list(STUDIES))
+	args = parser.parse_args()
+
+	names = args.datasets or list(STUDIES[args.study]['datasets'])
+	unknown = [name for name in names if name not in STUDIES[args.study]['datasets']]
+	if unknown:
+		parser.error(f'unknown dataset: {", ".join(unknown)}')
+
+	for name in names:
+		print(f'{name}: {convert_dataset(name, args.study)}')
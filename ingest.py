@@ -0,0 +1,153 @@
+import argparse
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from data_loader import DATASETS, SCHEMAS, append_rows, apply_schema, dataset_hash, load_dataset, read_dataset, update_rows
+from instrumentation import stage
+from store import file_lock, publish
+from studies import DEFAULT_STUDY, STUDIES, lru_get, lru_put, study_config, study_dir
+
+# dataset -> column identifying a post, rows already ingested are dropped on it
+POST_KEYS = {
+	'top_tweets': 'tweet_id',
+	'news_stories': 'link',
+	'facebook_top_posts': 'link',
+	'news_stories_facebook': 'link',
+	'youtube': 'videoId',
+	'tweets_stance': 'link',
+	'nyt': 'tweet_id',
+}
+
+# dataset -> engagement columns a refresh replaces on the posts already ingested
+POST_METRICS = {
+	'top_tweets': ['retweets', 'impressions'],
+	'news_stories': ['retweets', 'impressions'],
+	'facebook_top_posts': ['interactions'],
+	'news_stories_facebook': ['interactions'],
+	'youtube': ['viewCount', 'commentCount'],
+	'tweets_stance': ['retweets'],
+	'nyt': ['retweets'],
+}
+
+# (study, dataset name) -> (content hash, keys of the posts it holds)
+_keys = OrderedDict()
+_lock = threading.Lock()
+
+
+def inbox_dir(study=DEFAULT_STUDY):
+	return os.path.join(study_dir(study), 'inbox')
+
+
+def read_batch(path, schema):
+	if not path.endswith('.jsonl'):
+		return read_dataset(path, schema)
+
+	# dtype=False keeps ids and free text as they were written
+	df = pd.read_json(path, lines=True, dtype=False)
+	df = df.reindex(columns=SCHEMAS[schema]['columns']).astype(SCHEMAS[schema]['dtypes'])
+	return apply_schema(df, schema)
+
+
+def _post_keys(name, digest, study):
+	cached = lru_get(_keys, (study, name))
+	if cached is not None and cached[0] == digest:
+		return cached[1]
+
+	keys = set(load_dataset(name, [POST_KEYS[name]], study)[POST_KEYS[name]])
+	lru_put(_keys, (study, name), (digest, keys), 'frames')
+	return keys
+
+
+def _known(values, keys):
+	# a lookup per row of the batch; isin would copy the whole set of keys into a table every batch
+	return values.map(keys.__contains__).astype(bool)
+
+
+def ingest_batch(name, rows, study=DEFAULT_STUDY):
+	# appends the posts that are not in the dataset yet; the cached frames, timelines and
+	# graphs of it are extended with them on their next use, so the cost follows the size of
+	# the batch, in this process and in the workers serving the story
+	key = POST_KEYS[name]
+
+	with _lock, stage('ingest', dataset=name, study=study, rows=len(rows)) as record:
+		keys = _post_keys(name, dataset_hash(name, study), study)
+		rows = rows[rows[key].notna()].drop_duplicates(key)
+		rows = rows[~_known(rows[key], keys)].reset_index(drop=True)
+		record['added'] = len(rows)
+		if rows.empty:
+			return 0
+
+		digest = append_rows(name, rows, study)[1]
+		keys.update(rows[key])
+		lru_put(_keys, (study, name), (digest, keys), 'frames')
+		return len(rows)
+
+
+def known_posts(name, rows, study=DEFAULT_STUDY):
+	# mask of the rows whose post is already in the dataset
+	with _lock:
+		return _known(rows[POST_KEYS[name]], _post_keys(name, dataset_hash(name, study), study))
+
+
+def refresh_posts(name, rows, study=DEFAULT_STUDY):
+	# the metrics of posts already ingested are replaced, which rewrites the csv and rebuilds
+	# what was cached from it, so a collection refreshes all of its posts in one call
+	key = POST_KEYS[name]
+	metrics = [metric for metric in POST_METRICS[name] if metric in rows.columns]
+
+	with _lock, stage('refresh', dataset=name, study=study, rows=len(rows)) as record:
+		known = _known(rows[key], _post_keys(name, dataset_hash(name, study), study))
+		record['updated'] = update_rows(name, key, rows[known], metrics, study) if metrics and known.any() else 0
+		return record['updated']
+
+
+def ingest_file(name, path, study=DEFAULT_STUDY):
+	return ingest_batch(name, read_batch(path, DATASETS[name]), study)
+
+
+def ingest_inbox(study=DEFAULT_STUDY, inbox=None):
+	# batches are dropped in <inbox>/<dataset>/ and moved to <inbox>/<dataset>/done/ once appended;
+	# runs are serialized by an flock on <inbox>/LOCK, so a batch is claimed by one process only
+	inbox = inbox_dir(study) if inbox is None else inbox
+	added = {}
+	if not os.path.isdir(inbox):
+		return added
+
+	with file_lock(os.path.join(inbox, 'LOCK')):
+		for name in POST_KEYS:
+			folder = os.path.join(inbox, name)
+			if name not in study_config(study)['datasets'] or not os.path.isdir(folder):
+				continue
+
+			batches = sorted(entry.name for entry in os.scandir(folder) if entry.is_file() and entry.name.endswith(('.jsonl', '.csv')))
+			for batch in batches:
+				added[name] = added.get(name, 0) + ingest_file(name, os.path.join(folder, batch), study)
+				os.makedirs(os.path.join(folder, 'done'), exist_ok=True)
+				os.replace(os.path.join(folder, batch), os.path.join(folder, 'done', batch))
+
+	return added
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Append new batches of posts to the story datasets.')
+	parser.add_argument('dataset', nargs='?', help=f'dataset the batches belong to, one of {", ".join(POST_KEYS)}')
+	parser.add_argument('batches', nargs='*', help='jsonl or csv files with the dataset columns (default: everything in the inbox)')
+	parser.add_argument('--study', default=DEFAULT_STUDY, choices=list(STUDIES))
+	parser.add_argument('--inbox', default=None, help="inbox directory (default: inbox/ in the study's data directory)")
+	parser.add_argument('--publish', action='store_true', help='publish a new version of the shared artifact store afterwards')
+	args = parser.parse_args()
+
+	if args.dataset is None:
+		for name, count in ingest_inbox(args.study, args.inbox).items():
+			print(f'{name}: {count} new posts')
+	else:
+		if args.dataset not in POST_KEYS or args.dataset not in study_config(args.study)['datasets']:
+			parser.error(f'unknown dataset: {args.dataset}')
+		for path in args.batches:
+			print(f'{path}: {ingest_file(args.dataset, path, args.study)} new posts')
+
+	if args.publish:
+		print(f'published {publish(args.study)}')
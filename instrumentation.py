@@ -0,0 +1,107 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+
+logger = logging.getLogger('story.stages')
+
+# every streamlit session runs its script in its own thread, so records are per thread; threads that
+# never start a run (pool and to_thread workers) keep only the latest ones
+_local = threading.local()
+RECORDS_LIMIT = 1000
+
+
+def debug_enabled():
+	return os.environ.get('STORY_DEBUG', '') not in ('', '0')
+
+
+def enable_stage_logging(level=logging.INFO):
+	# one json line per stage on stderr; otherwise the records only reach the handlers the host
+	# configured, and python's default drops info messages
+	if not logger.handlers:
+		handler = logging.StreamHandler()
+		handler.setFormatter(logging.Formatter('%(message)s'))
+		logger.addHandler(handler)
+		logger.propagate = False
+	logger.setLevel(level)
+
+
+def enable_memory_tracing():
+	# tracemalloc is process wide, concurrent sessions show up in each other's numbers
+	if not tracemalloc.is_tracing():
+		tracemalloc.start()
+
+
+def start_run(run_id=None):
+	_local.run_id = run_id or uuid.uuid4().hex[:8]
+	_local.records = deque(maxlen=RECORDS_LIMIT)
+	_local.stack = []
+
+
+def records():
+	return list(getattr(_local, 'records', []))
+
+
+@contextmanager
+def stage(name, **fields):
+	record = {'stage': name, **fields}
+	stack = getattr(_local, 'stack', None)
+	if stack is None:
+		start_run()
+		stack = _local.stack
+
+	tracing = tracemalloc.is_tracing()
+	if tracing:
+		current, peak = tracemalloc.get_traced_memory()
+		if stack:
+			stack[-1]['_peak'] = max(stack[-1].get('_peak', 0), peak)
+		tracemalloc.reset_peak()
+		record['_base'] = current
+
+	stack.append(record)
+	start = time.perf_counter()
+	try:
+		yield record
+	finally:
+		record['seconds'] = round(time.perf_counter() - start, 6)
+		stack.pop()
+
+		if tracing:
+			current, peak = tracemalloc.get_traced_memory()
+			peak = max(peak, record.pop('_peak', 0))
+			base = record.pop('_base')
+			record['allocated_bytes'] = current - base
+			record['peak_bytes'] = peak - base
+			if stack:
+				stack[-1]['_peak'] = max(stack[-1].get('_peak', 0), peak)
+
+		record['depth'] = len(stack)
+		record['run'] = _local.run_id
+		_local.records.append(record)
+		logger.info(json.dumps(record, default=str))
+
+
+def timed(name=None):
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			with stage(name or func.__name__):
+				return func(*args, **kwargs)
+		return wrapper
+	return decorator
+
+
+def payload_size(payload):
+	if isinstance(payload, str):
+		return len(payload.encode('utf-8'))
+	if isinstance(payload, bytes):
+		return len(payload)
+	# altair charts, measured as the spec the browser receives
+	return len(payload.to_json().encode('utf-8'))
@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from studies import DEFAULT_STUDY
+
+
+# dense ids fit in 32 bits, a quarter of the size of a pointer to a python string plus the string
+ID_DTYPE = np.int32
+
+VOCABULARIES = ('usernames', 'links')
+
+# (study, vocabulary) -> (string -> id, strings in id order); a vocabulary only grows, so ids handed
+# out earlier stay valid for the life of the process, and every study has its own, so a study's
+# vocabularies hold the strings of its datasets and no more
+_vocabularies = {}
+_lock = threading.Lock()
+
+
+def _vocabulary(vocabulary, study):
+	if vocabulary not in VOCABULARIES:
+		raise KeyError(vocabulary)
+	return _vocabularies.setdefault((study, vocabulary), ({}, []))
+
+
+def intern(vocabulary, values, study=DEFAULT_STUDY):
+	# every distinct string is looked up once, and only the new ones are added; missing values
+	# share the id of None
+	codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+	uniques = np.asarray(uniques, dtype=object)
+	uniques[pd.isna(uniques)] = None
+	with _lock:
+		index, known = _vocabulary(vocabulary, study)
+		size = len(known)
+		ids = np.fromiter((index.setdefault(value, len(index)) for value in uniques), dtype=np.int64, count=len(uniques))
+		known.extend(uniques[ids >= size])
+	return ids[codes].astype(ID_DTYPE)
+
+
+def lookup(vocabulary, values, study=DEFAULT_STUDY):
+	# ids of strings already interned, -1 for the others, without adding them
+	with _lock:
+		index = _vocabulary(vocabulary, study)[0]
+		return np.array([index.get(value, -1) for value in values], dtype=ID_DTYPE)
+
+
+def strings(vocabulary, ids, study=DEFAULT_STUDY):
+	ids = np.asarray(ids, dtype=np.int64)
+	labels = np.empty(len(ids), dtype=object)
+	with _lock:
+		known = _vocabulary(vocabulary, study)[1]
+		labels[:] = [known[i] for i in ids.tolist()]
+	return labels
+
+
+def vocabulary_size(vocabulary, study=DEFAULT_STUDY):
+	with _lock:
+		return len(_vocabulary(vocabulary, study)[1])
+
+
+def code_lookup(vocabulary, values, categories, study=DEFAULT_STUDY):
+	# dense array from id to the code of its category, -1 where the id has none, so a
+	# lookup for any number of ids is one fancy index instead of a dict access each
+	ids = intern(vocabulary, values, study)
+	codes = np.full(vocabulary_size(vocabulary, study), -1, dtype=np.int8)
+	codes[ids] = categories
+	return codes
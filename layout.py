@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+
+# keep the pairwise repulsion blocks around this many floats so memory stays flat
+_BLOCK_SIZE = 4_000_000
+
+
+def _edge_indices(G):
+	nodes = pd.Index(list(G.nodes))
+	edges = np.array(list(G.edges), dtype=object).reshape(-1, 2)
+	sources = nodes.get_indexer(edges[:, 0])
+	targets = nodes.get_indexer(edges[:, 1])
+	keep = sources != targets
+	return sources[keep], targets[keep]
+
+
+def _normalize(pos):
+	pos = pos - pos.mean(axis=0)
+	extent = np.abs(pos).max()
+	return pos / extent if extent > 0 else pos
+
+
+def random_layout(n, seed=0):
+	rng = np.random.default_rng(seed)
+	return rng.uniform(-1, 1, size=(n, 2))
+
+
+def spectral_layout(n, sources, targets, seed=0):
+	if n < 3:
+		return random_layout(n, seed)
+
+	from scipy import sparse
+	from scipy.sparse.linalg import ArpackNoConvergence, eigsh
+
+	adjacency = sparse.coo_matrix((np.ones(len(sources)), (sources, targets)), shape=(n, n)).tocsr()
+	adjacency = ((adjacency + adjacency.T) > 0).astype(np.float64)
+	laplacian = sparse.diags(np.asarray(adjacency.sum(axis=1)).ravel()) - adjacency
+
+	rng = np.random.default_rng(seed)
+	try:
+		# the two smallest non-trivial eigenvectors of the laplacian give the coordinates
+		_, vectors = eigsh(laplacian, k=3, which='SM', tol=1e-4, v0=rng.uniform(size=n), maxiter=n * 10)
+	except ArpackNoConvergence:
+		return random_layout(n, seed)
+
+	# jitter separates nodes that share coordinates, e.g. leaves of the same link
+	return _normalize(vectors[:, 1:3]) + rng.normal(scale=0.01, size=(n, 2))
+
+
+def force_layout(n, sources, targets, iterations=50, seed=0, initial=None, gravity=0.1):
+	# Fruchterman-Reingold with the pairwise repulsion computed in vectorized blocks
+	pos = random_layout(n, seed) if initial is None else np.array(initial, dtype=np.float64)
+	if n < 2:
+		return pos
+
+	k = 1 / np.sqrt(n)
+	temperature = 0.1
+	cooling = temperature / (iterations + 1)
+	block = max(1, _BLOCK_SIZE // n)
+
+	for _ in range(iterations):
+		displacement = np.zeros_like(pos)
+
+		for start in range(0, n, block):
+			delta = pos[start:start + block, None, :] - pos[None, :, :]
+			distance2 = np.maximum((delta ** 2).sum(axis=-1), 1e-9)
+			displacement[start:start + block] += (delta * (k * k / distance2)[..., None]).sum(axis=1)
+
+		delta = pos[sources] - pos[targets]
+		distance = np.maximum(np.sqrt((delta ** 2).sum(axis=-1)), 1e-9)
+		pull = delta * (distance / k)[:, None]
+		np.add.at(displacement, sources, -pull)
+		np.add.at(displacement, targets, pull)
+
+		# gravity keeps disconnected components from drifting apart
+		displacement -= gravity * pos
+
+		length = np.maximum(np.sqrt((displacement ** 2).sum(axis=-1)), 1e-9)
+		pos += displacement * (np.minimum(length, temperature) / length)[:, None]
+		temperature -= cooling
+
+	return _normalize(pos)
+
+
+def compute_layout(G, method='force', iterations=50, seed=0, scale=100):
+	n = G.number_of_nodes()
+	sources, targets = _edge_indices(G)
+
+	if method == 'spectral':
+		pos = spectral_layout(n, sources, targets, seed)
+	elif method == 'force':
+		# start from the spectral embedding so fewer force iterations are needed
+		pos = force_layout(n, sources, targets, iterations, seed, initial=spectral_layout(n, sources, targets, seed))
+	else:
+		raise ValueError(f"unknown layout method: {method}")
+
+	# vis.js works in pixels, spread the unit square with the size of the graph
+	pos = pos * scale * np.sqrt(max(n, 1))
+	return {node: (float(x), float(y)) for node, (x, y) in zip(G.nodes, pos)}
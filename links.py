@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from data_loader import dataset_hash, load_dataset
+from instrumentation import timed
+from studies import DEFAULT_STUDY, cached_build, study_config
+
+
+# query parameters that only track the click or pick the AMP page, dropped from every link; short
+# keys such as s (a search) or t (a video offset) change what the link shows and are kept
+TRACKING_PARAMS = r'utm_[^=&]*|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|igshid|smid|smtyp|cmpid|ocid|ref_src|amp|outputtype'
+
+# dataset -> (platform, link column, engagement columns summed per story)
+STORY_SOURCES = {
+	'news_stories': ('twitter', 'link', ['retweets', 'impressions']),
+	'news_stories_facebook': ('facebook', 'link', ['interactions']),
+}
+
+# study -> (content hashes of the sources, engagement per story)
+_stories = OrderedDict()
+# key -> [lock, callers] of the builds in progress, see key_lock
+_building = {}
+_lock = threading.Lock()
+
+
+def _canonical(links):
+	# scheme, fragment, www/mobile/amp hosts, amp paths, tracking parameters and trailing
+	# slashes removed, the host lowercased; the path keeps its case
+	parts = links.str.strip().str.replace(r'#.*$', '', regex=True).str.replace(r'^[a-zA-Z][a-zA-Z0-9+.-]*://', '', regex=True).str.extract(r'^([^/?]*)([^?]*)\??(.*)$')
+	host = parts[0].str.lower().str.replace(r':(?:80|443)$', '', regex=True).str.replace(r'^(?:www\d*|m|mobile|amp)\.', '', regex=True)
+	path = parts[1].str.replace(r'(?:/amp)+(?=/|$)|\.amp$', '', regex=True).str.rstrip('/')
+	query = parts[2].str.replace(rf'(?:^|&)(?:{TRACKING_PARAMS})(?:=[^&]*)?(?=&|$)', '', regex=True, case=False).str.lstrip('&')
+	return host + path + np.where(query == '', '', '?' + query)
+
+
+def _story_codes(links):
+	# story code of every row (-1 without a link, or with a blank one) and the canonical link of every
+	# code; every distinct link is canonicalized once, shared links repeat a lot across posts
+	codes, uniques = pd.factorize(pd.Series(links, dtype=object))
+	canonical = _canonical(pd.Series(uniques, dtype=object))
+	stories, canonical = pd.factorize(canonical.where(canonical != ''))
+	return np.where(codes >= 0, stories[np.maximum(codes, 0)], -1), canonical.to_numpy(dtype=object)
+
+
+def canonical_links(links):
+	codes, canonical = _story_codes(links)
+	return pd.Series(np.where(codes >= 0, canonical[np.maximum(codes, 0)], None), index=getattr(links, 'index', None), dtype=object)
+
+
+def link_hashes(canonical):
+	# 64 bit hash of every canonical link, the key of the link index and its joins
+	return pd.util.hash_array(np.asarray(canonical, dtype=object).astype(str))
+
+
+def link_index(df, column, metrics):
+	# one row per canonical link, keyed by its hash: the link, the stance of its first post, the
+	# number of posts and the sum of the metrics
+	codes, canonical = _story_codes(df[column])
+	rows = np.flatnonzero(codes >= 0)
+	codes = codes[rows]
+	first = np.full(len(canonical), len(df))
+	np.minimum.at(first, codes, rows)
+	return pd.DataFrame({
+		'link': canonical,
+		'stance': df['stance'].astype(object).to_numpy()[first],
+		'posts': np.bincount(codes, minlength=len(canonical)),
+		**{metric: np.bincount(codes, weights=df[metric].to_numpy()[rows], minlength=len(canonical)).astype('int64') for metric in metrics},
+	}, index=pd.Index(link_hashes(canonical), name='hash'))
+
+
+def join_stories(indexes, platforms):
+	# outer join of the link indexes of the platforms, stories missing on a platform have no posts
+	# and no engagement there; a study without news story exports has no stories
+	if not indexes:
+		return pd.DataFrame({'link': pd.Series(dtype=object), 'stance': pd.Series(dtype=object), 'platforms': pd.Series(dtype='int64')}, index=pd.Index([], dtype='uint64', name='hash'))
+	stories = pd.concat(indexes, axis=1, join='outer')
+	link, stance = stories.pop(f'{platforms[0]}_link'), stories.pop(f'{platforms[0]}_stance')
+	for platform in platforms[1:]:
+		link = link.combine_first(stories.pop(f'{platform}_link'))
+		stance = stance.combine_first(stories.pop(f'{platform}_stance'))
+	stories['platforms'] = stories[[f'{platform}_posts' for platform in platforms]].notna().sum(axis=1)
+	stories = stories.fillna(0).astype('int64')
+	stories.insert(0, 'stance', stance)
+	stories.insert(0, 'link', link)
+	return stories
+
+
+@timed()
+def story_engagement(study=DEFAULT_STUDY):
+	# engagement of every news story across platforms, one hash join of the link indexes
+	sources = [name for name in STORY_SOURCES if name in study_config(study)['datasets']]
+	digests = tuple(dataset_hash(name, study) for name in sources)
+
+	def build():
+		indexes = []
+		for name in sources:
+			platform, column, metrics = STORY_SOURCES[name]
+			index = link_index(load_dataset(name, [column, 'stance', *metrics], study), column, metrics)
+			indexes.append(index.rename(columns={'link': f'{platform}_link', 'stance': f'{platform}_stance', 'posts': f'{platform}_posts'}))
+		return join_stories(indexes, [STORY_SOURCES[name][0] for name in sources])
+
+	return cached_build(_stories, _building, _lock, study, digests, build, 'links')
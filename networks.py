@@ -0,0 +1,619 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from communities import community_colors, louvain, only_added_edges, warm_start_partition
+from concentration import filter_dataset
+from data_loader import DATA_DIR, appended_rows, dataset_hash, load_dataset
+from instrumentation import stage, timed
+from interning import code_lookup, intern, lookup, strings
+from layout import compute_layout
+from store import store_page
+from studies import DEFAULT_STUDY, STANCE_COLORS, STUDIES, cached_build, key_lock, lru_get, lru_put, study_config, study_dir
+
+
+CACHE_DIR = os.path.join(DATA_DIR, '.graph_cache')
+
+# 'auto' lays out graphs above the threshold in python and turns off the physics in the browser; the
+# threshold stays below the max_nodes of the styles, pages are never larger than that once pruned
+DEFAULT_LAYOUT = {'mode': 'auto', 'method': 'force', 'threshold': 1000, 'iterations': 50, 'seed': 0}
+
+# link node ids start past the 32 bit range of interned username ids
+LINK_OFFSET = 1 << 32
+
+# ids of aggregate nodes, the accounts that only shared one link collapsed per link and group,
+# start past every link id: AGGREGATE_OFFSET + link id * AGGREGATE_GROUPS + group + 1
+AGGREGATE_OFFSET = 1 << 48
+AGGREGATE_GROUPS = 16
+
+# colour vis.js gives a node without one, used by the json export
+VIS_NODE_COLOR = '#97c2fc'
+
+# styling parameters are part of the artifact key, changing any of them rebuilds the page
+NETWORK_STYLES = {
+	'nytimes': {
+		'height': '700px',
+		'width': '1200px',
+		'bgcolor': '#222222',
+		'font_color': 'white',
+		'node_distance': 800,
+		'central_gravity': 0.01,
+		'spring_length': 150,
+		'community_colors': ["#32CD32", "#FF7F7F"],
+		'seed': 0,
+		'retweets_per_size': 10,
+		'layout': DEFAULT_LAYOUT,
+		# nodes a page may have before it is pruned, and tweets listed in a tooltip
+		'max_nodes': 2000,
+		'tooltip_tweets': 10,
+	},
+	'full_links': {
+		'height': '700px',
+		'width': '100%',
+		'bgcolor': '#222222',
+		'font_color': 'white',
+		'node_distance': 800,
+		'central_gravity': 0.01,
+		'spring_length': 150,
+		'stance_colors': STANCE_COLORS,
+		'default_edge_color': '#0000FF',
+		'size_per_link': 30,
+		'layout': DEFAULT_LAYOUT,
+		'max_nodes': 2000,
+		'tooltip_tweets': 10,
+	},
+}
+
+
+def artifact_path(key, extension='.html'):
+	return os.path.join(CACHE_DIR, key + extension)
+
+
+def _write_atomic(path, text):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+	with open(tmp_path, 'w', encoding='utf-8') as f:
+		f.write(text)
+	os.replace(tmp_path, path)
+
+
+def _new_network(style):
+	# pyvis, networkx and the community detection are imported by the builders that use them,
+	# so importing this module (the story, ingest) does not load them
+	from pyvis.network import Network
+
+	net = Network(height=style['height'], width=style['width'], notebook=True, bgcolor=style['bgcolor'], font_color=style['font_color'])
+	return net
+
+
+def _add_graph(net, G):
+	# the nodes and edges Network.from_nx adds for a graph without attributes, in the same order,
+	# without the scans of every node and edge it does per edge (quadratic past a few thousand)
+	from pyvis.network import Edge, Node
+
+	edges = list(G.edges)
+	nodes = list(dict.fromkeys(node for edge in edges for node in edge))
+	nodes += [node for node, degree in G.degree if degree == 0]
+	for node_id in nodes:
+		node = Node(node_id, 'dot', label=node_id, color=VIS_NODE_COLOR, font_color=net.font_color, size=10)
+		net.nodes.append(node.options)
+		net.node_ids.append(node_id)
+		net.node_map[node_id] = node.options
+	for source, target in edges:
+		net.edges.append(Edge(source, target, net.directed, width=1).options)
+
+
+def _apply_physics(net, style):
+	net.barnes_hut(overlap=1)
+	net.repulsion(node_distance=style['node_distance'], central_gravity=style['central_gravity'], spring_length=style['spring_length'])
+
+
+def graph_hash(G):
+	digest = hashlib.sha256()
+	digest.update('\x1f'.join(map(str, G.nodes)).encode('utf-8'))
+	digest.update(b'\x1e')
+	digest.update('\x1f'.join(f'{u}\x1d{v}' for u, v in G.edges).encode('utf-8'))
+	return digest.hexdigest()
+
+
+@timed()
+def node_positions(G, layout=DEFAULT_LAYOUT):
+	# positions only depend on the graph, so restyling a network reuses them
+	params = {key: layout[key] for key in ('method', 'iterations', 'seed')}
+	payload = json.dumps({'graph': graph_hash(G), 'layout': params}, sort_keys=True)
+	path = artifact_path(hashlib.sha256(payload.encode('utf-8')).hexdigest(), '.layout.json')
+
+	if os.path.exists(path):
+		with open(path, 'r', encoding='utf-8') as f:
+			return {node: tuple(xy) for node, xy in json.load(f)}
+
+	positions = compute_layout(G, **params)
+	_write_atomic(path, json.dumps([[node, xy] for node, xy in positions.items()]))
+	return positions
+
+
+def _read_json(path):
+	with open(path, 'r', encoding='utf-8') as f:
+		return json.load(f)
+
+
+# network name -> (graph hash, partition) of the latest community detection
+_partitions = OrderedDict()
+# network name -> [lock, callers] of the detections in progress, see key_lock
+_detecting = {}
+_partition_lock = threading.Lock()
+
+
+@timed()
+def node_communities(G, seed=0, name=None):
+	# memoized per graph content, an appended graph warm-starts from the last partition of the same network
+	key = graph_hash(G)
+
+	def detect():
+		path = artifact_path(hashlib.sha256(f'{key}:{seed}'.encode('utf-8')).hexdigest(), '.partition.json')
+		if os.path.exists(path):
+			return dict(_read_json(path))
+
+		initial = None
+		latest_path = artifact_path(name, '.partition.json') if name else None
+		if latest_path and os.path.exists(latest_path):
+			latest = _read_json(latest_path)
+			if latest['seed'] == seed and only_added_edges(G, latest['edges']):
+				initial = warm_start_partition(G, dict(latest['partition']))
+
+		partition = louvain(G, seed, initial)
+		_write_atomic(path, json.dumps(list(partition.items())))
+		if latest_path:
+			_write_atomic(latest_path, json.dumps({'seed': seed, 'edges': list(G.edges), 'partition': list(partition.items())}))
+		return partition
+
+	if not name:
+		return detect()
+	return cached_build(_partitions, _detecting, _partition_lock, name, key, detect, 'graphs')
+
+
+def _apply_layout(net, G, style):
+	layout = style['layout']
+	if layout['mode'] == 'browser' or (layout['mode'] == 'auto' and G.number_of_nodes() <= layout['threshold']):
+		_apply_physics(net, style)
+		return
+
+	positions = node_positions(G, layout)
+	for node in net.nodes:
+		node['x'], node['y'] = positions[node['id']]
+	net.toggle_physics(False)
+
+
+def share_ids(df, study=DEFAULT_STUDY):
+	return intern('usernames', df['username'].to_numpy(), study), intern('links', df['original_link'].to_numpy(), study)
+
+
+def share_nodes(user_ids, link_ids):
+	# users and links live in one graph, link nodes are their id offset past every user id
+	return np.column_stack([user_ids.astype(np.int64), link_ids.astype(np.int64) + LINK_OFFSET])
+
+
+def node_labels(nodes, study=DEFAULT_STUDY):
+	# aggregate nodes have no string of their own and are left as None
+	nodes = np.asarray(nodes, dtype=np.int64)
+	is_link = (nodes >= LINK_OFFSET) & (nodes < AGGREGATE_OFFSET)
+	is_user = nodes < LINK_OFFSET
+	labels = np.empty(len(nodes), dtype=object)
+	labels[is_user] = strings('usernames', nodes[is_user], study)
+	labels[is_link] = strings('links', nodes[is_link] - LINK_OFFSET, study)
+	return labels
+
+
+def aggregate_groups(nodes):
+	# group code of aggregate node ids, -1 when the accounts had none
+	return (np.asarray(nodes, dtype=np.int64) - AGGREGATE_OFFSET) % AGGREGATE_GROUPS - 1
+
+
+@timed()
+def build_share_graph(df, tweet_column='link', directed=False, study=DEFAULT_STUDY):
+	# df has one row per shared tweet: username, original_link, retweets and the tweet url;
+	# the graph and the aggregates are keyed on the ids interned for the study, see node_labels
+	user_ids, link_ids = share_ids(df, study)
+	retweets = df['retweets'].to_numpy()
+
+	# per-user aggregates from one stable sort instead of a python loop over rows
+	user_codes, user_index = pd.factorize(user_ids)
+	order = np.argsort(user_codes, kind='stable')
+	tweet_counts = np.bincount(user_codes, minlength=len(user_index))
+	tweets = np.split(df[tweet_column].to_numpy()[order], np.cumsum(tweet_counts)[:-1])
+	link_codes, link_index = pd.factorize(link_ids)
+
+	# the distinct (user, link) pairs are the edges, and count the links of a user and the users of a link
+	pairs = pd.DataFrame({'user': user_codes, 'link': link_codes}).drop_duplicates()
+
+	users = pd.DataFrame({
+		'tweets': pd.Series(tweets, index=user_index, dtype=object),
+		'retweets': np.bincount(user_codes, weights=retweets, minlength=len(user_index)).astype('int64'),
+		'links': np.bincount(pairs['user'], minlength=len(user_index)),
+	}, index=user_index)
+
+	shared_links = pd.DataFrame({
+		'shares': np.bincount(link_codes, minlength=len(link_index)),
+		'users': np.bincount(pairs['link'], minlength=len(link_index)),
+		'retweets': np.bincount(link_codes, weights=retweets, minlength=len(link_index)).astype('int64'),
+	}, index=link_index)
+
+	# nodes keep the order in which they first appear, as if added row by row
+	nodes = pd.unique(share_nodes(user_ids, link_ids).ravel())
+	edges = share_nodes(user_index[pairs['user']], link_index[pairs['link']])
+
+	import networkx as nx
+
+	G = nx.DiGraph() if directed else nx.Graph()
+	G.add_nodes_from(nodes.tolist())
+	G.add_edges_from(edges.tolist())
+
+	return G, users, shared_links
+
+
+def extend_share_graph(graph, rows, tweet_column='link', study=DEFAULT_STUDY):
+	# adds a batch of rows to a copy of the graph and aggregates of build_share_graph, the result
+	# is the same as building from the whole history; the graph passed in may be in use elsewhere
+	G, users, shared_links = graph
+	G, users, shared_links = G.copy(), users.copy(), shared_links.copy()
+	_, batch_users, batch_links = build_share_graph(rows, tweet_column, G.is_directed(), study)
+
+	user_ids, link_ids = share_ids(rows, study)
+	pairs = pd.DataFrame(share_nodes(user_ids, link_ids), columns=['user', 'link']).drop_duplicates()
+	new_pairs = pairs[[not G.has_edge(user, link) for user, link in pairs.itertuples(index=False)]]
+
+	G.add_nodes_from(pd.unique(share_nodes(user_ids, link_ids).ravel()).tolist())
+	G.add_edges_from(new_pairs.to_numpy().tolist())
+
+	batch_users['links'] = new_pairs.groupby('user', sort=False).size().reindex(batch_users.index, fill_value=0)
+	known = batch_users.index.isin(users.index)
+	old = batch_users.index[known]
+	users.loc[old, 'retweets'] += batch_users.loc[old, 'retweets']
+	users.loc[old, 'links'] += batch_users.loc[old, 'links']
+	users.loc[old, 'tweets'] = pd.Series([np.concatenate([before, after]) for before, after in zip(users.loc[old, 'tweets'], batch_users.loc[old, 'tweets'])], index=old, dtype=object)
+
+	batch_links['users'] = new_pairs.groupby(new_pairs['link'] - LINK_OFFSET, sort=False).size().reindex(batch_links.index, fill_value=0)
+	known_links = batch_links.index.isin(shared_links.index)
+	shared_links.loc[batch_links.index[known_links]] += batch_links[known_links]
+
+	return G, pd.concat([users, batch_users[~known]]), pd.concat([shared_links, batch_links[~known_links]])
+
+
+# (study, dataset name, tweet column, directed) -> (content hash, graph and aggregates)
+_graphs = OrderedDict()
+# key -> [lock, callers] of the builds in progress, see key_lock
+_graph_building = {}
+_graph_lock = threading.Lock()
+
+
+def share_graph(name, tweet_column='link', directed=False, study=DEFAULT_STUDY):
+	# the returned graph is shared, callers must not modify it in place
+	key = (study, name, tweet_column, directed)
+	digest = dataset_hash(name, study)
+	build = lambda: build_share_graph(load_dataset(name, study=study), tweet_column, directed, study)
+
+	def extend(previous, graph):
+		# a graph of the content before an append gets the edges of the appended rows
+		rows = appended_rows(name, previous, digest, study)
+		return None if rows is None else extend_share_graph(graph, rows, tweet_column, study)
+
+	return cached_build(_graphs, _graph_building, _graph_lock, key, digest, build, 'graphs', extend)
+
+
+
+@timed()
+def prune_share_graph(graph, max_nodes, groups=None):
+	# keeps a page within max_nodes: accounts that only shared one link are collapsed into a node
+	# per link and group, then the least retweeted accounts and the least shared links are dropped.
+	# groups maps a username id to a group code (the stance of the account), -1 for none
+	G, users, shared_links = graph
+	if G.number_of_nodes() <= max_nodes:
+		return graph
+
+	edges = np.array(list(G.edges), dtype=np.int64).reshape(-1, 2)
+	# user ids are below every link id, whichever way the edge was stored
+	edges = np.column_stack([edges.min(axis=1), edges.max(axis=1)])
+	user_ids = users.index.to_numpy(dtype=np.int64)
+	leaf = users['links'].to_numpy() == 1
+	leaf_edges = np.isin(edges[:, 0], user_ids[leaf])
+
+	# the aggregate node of every leaf account, from the one link it shared and its group
+	leaf_users = users[leaf]
+	leaf_links = pd.Series(edges[leaf_edges, 1], index=edges[leaf_edges, 0]).reindex(leaf_users.index.to_numpy(dtype=np.int64)).to_numpy()
+	group = np.full(len(leaf_users), -1, dtype=np.int64)
+	if groups is not None and len(groups):
+		ids = leaf_users.index.to_numpy(dtype=np.int64)
+		group = np.where(ids < len(groups), groups[np.minimum(ids, len(groups) - 1)], -1).astype(np.int64)
+	aggregate_ids = AGGREGATE_OFFSET + (leaf_links - LINK_OFFSET) * AGGREGATE_GROUPS + group + 1
+
+	members = pd.Series(np.arange(len(leaf_users))).groupby(aggregate_ids, sort=False).indices
+	keys = np.fromiter(members, dtype=np.int64, count=len(members))
+	tweets = leaf_users['tweets'].to_numpy()
+	retweets = leaf_users['retweets'].to_numpy()
+	aggregates = pd.DataFrame({
+		'tweets': pd.Series([np.concatenate(list(tweets[rows])) for rows in members.values()], index=keys, dtype=object),
+		'retweets': [int(retweets[rows].sum()) for rows in members.values()],
+		'links': 1,
+		'accounts': [len(rows) for rows in members.values()],
+	}, index=keys)
+	accounts = pd.concat([users[~leaf].assign(accounts=1).set_axis(user_ids[~leaf]), aggregates])
+
+	# the most retweeted accounts first, then the most shared of their links, within the budget
+	account_edges = np.concatenate([edges[~leaf_edges], np.column_stack([aggregate_ids, leaf_links])])
+	account_edges = pd.DataFrame(account_edges).drop_duplicates().to_numpy()
+	links = np.unique(account_edges[:, 1])
+	budget = max(max_nodes - len(links), max_nodes // 2)
+	kept = accounts.index.to_numpy()[np.argsort(-accounts['retweets'].to_numpy(), kind='stable')[:budget]]
+	account_edges = account_edges[np.isin(account_edges[:, 0], kept)]
+
+	links = np.unique(account_edges[:, 1])
+	if len(links) > max_nodes - budget:
+		shares = shared_links['shares'].reindex(links - LINK_OFFSET).to_numpy()
+		links = links[np.argsort(-shares, kind='stable')[:max_nodes - budget]]
+		account_edges = account_edges[np.isin(account_edges[:, 1], links)]
+
+	import networkx as nx
+
+	pruned = nx.DiGraph() if G.is_directed() else nx.Graph()
+	pruned.add_nodes_from(pd.unique(account_edges.ravel()).tolist())
+	pruned.add_edges_from(account_edges.tolist())
+	kept = accounts.index.isin(list(pruned.nodes))
+	return pruned, accounts[kept], shared_links.loc[shared_links.index.isin(np.unique(account_edges[:, 1]) - LINK_OFFSET)]
+
+
+def _tweets_title(heading, tweets, limit=None):
+	# capped at limit, the full list of an account is looked up on request, see account_tweets
+	shown = tweets if limit is None else tweets[:limit]
+	formatted_tweets = "<br>".join([f'<a href="{t}" target="_blank">{t}</a>' for t in shown])
+	more = f'<br>and {len(tweets) - len(shown)} more' if len(tweets) > len(shown) else ''
+	return f"{heading}<br>{formatted_tweets}{more}"
+
+
+def _label_nodes(net, users, study):
+	# strings are only looked up here, for the nodes of the page being rendered; an aggregate
+	# node is labelled with the number of accounts it stands for
+	ids = [node['id'] for node in net.nodes]
+	found = users.reindex(ids)
+	accounts = found['accounts'].fillna(1).astype('int64').tolist() if 'accounts' in found else [1] * len(ids)
+	for node, label, count in zip(net.nodes, node_labels(ids, study), accounts):
+		node['label'] = f'{count} accounts' if node['id'] >= AGGREGATE_OFFSET else label
+	return found
+
+
+def _title_nodes(net, found, style):
+	for node, tweets in zip(net.nodes, found['tweets']):
+		heading = f"{node['label']} that only shared this link" if node['id'] >= AGGREGATE_OFFSET else f"Username: {node['label']}"
+		node['title'] = _tweets_title(heading, tweets if isinstance(tweets, np.ndarray) else [], style.get('tooltip_tweets'))
+
+
+@timed()
+def create_network(df, style=NETWORK_STYLES['nytimes'], name=None, graph=None, study=DEFAULT_STUDY):
+	graph = graph or build_share_graph(df, tweet_column='tweet', study=study)
+	G, users, _ = prune_share_graph(graph, style['max_nodes']) if style.get('max_nodes') else graph
+
+	net = _new_network(style)
+	_add_graph(net, G)
+	_apply_layout(net, G, style)
+
+	partition = node_communities(G, style['seed'], name)
+	color_mapping = community_colors(partition, style['community_colors'])
+
+	found = _label_nodes(net, users, study)
+	_title_nodes(net, found, style)
+	retweets = found['retweets'].fillna(0).astype('int64').tolist()
+	for node, node_retweets in zip(net.nodes, retweets):
+		node['color'] = color_mapping[node['id']]
+		node['size'] = node_retweets / style['retweets_per_size']
+
+	return net
+
+
+@timed()
+def create_links_network(tweets_stance, color_code, style=NETWORK_STYLES['full_links'], graph=None, study=DEFAULT_STUDY):
+	graph = graph or build_share_graph(tweets_stance, tweet_column='link', directed=True, study=study)
+
+	# accuracy ratio of every interned username, looked up for all nodes at once
+	stances = list(style['stance_colors'])
+	accuracy_codes = code_lookup('usernames', color_code['username'].to_numpy(), pd.Categorical(color_code['accuracy_ratio'], categories=stances).codes, study)
+	G, users, _ = prune_share_graph(graph, style['max_nodes'], accuracy_codes) if style.get('max_nodes') else graph
+
+	net = _new_network(style)
+	_add_graph(net, G)
+	_apply_layout(net, G, style)
+
+	found = _label_nodes(net, users, study)
+	ids = np.array([node['id'] for node in net.nodes], dtype=np.int64)
+	# ids without a code (links, aggregates, accounts never labelled) index the -1 appended to the codes
+	node_codes = np.append(accuracy_codes, -1)[np.where(ids < len(accuracy_codes), ids, len(accuracy_codes))]
+	node_codes = np.where(ids >= AGGREGATE_OFFSET, aggregate_groups(ids), node_codes)
+	_title_nodes(net, found, style)
+	links = found['links'].fillna(0).astype('int64').tolist()
+	for node, node_links, code in zip(net.nodes, links, node_codes.tolist()):
+		node['size'] = node_links * style['size_per_link']
+
+		# Set the node color based on the accuracy_ratio value
+		if code >= 0:
+			node['color'] = style['stance_colors'][stances[code]]
+
+	with stage('colour edges', edges=len(net.edges)):
+		for edge in net.edges:
+			edge['color'] = net.get_node(edge['from']).get('color', style['default_edge_color'])
+
+	return net
+
+
+# network name -> (dataset, tweet column, directed) of its share graph
+SHARE_GRAPHS = {
+	'nytimes': ('nyt', 'tweet', False),
+	'full_links': ('tweets_stance', 'link', True),
+}
+
+
+def network_graph(name, study=DEFAULT_STUDY, coverage=None):
+	dataset, tweet_column, directed = SHARE_GRAPHS[name]
+	if coverage is None:
+		return share_graph(dataset, tweet_column, directed, study)
+	return build_share_graph(filter_dataset(dataset, coverage, study=study), tweet_column, directed, study)
+
+
+def account_tweets(name, username, study=DEFAULT_STUDY):
+	# every tweet of an account in a network, the tooltips of the page only list the first few
+	_, users, _ = network_graph(name, study)
+	ids = lookup('usernames', [username], study)
+	if ids[0] < 0 or ids[0] not in users.index:
+		return []
+	return list(users.at[ids[0], 'tweets'])
+
+
+def _build_nytimes(style, study, coverage=None):
+	return create_network(None, style, name=f'{study}.nytimes', graph=network_graph('nytimes', study, coverage), study=study)
+
+
+def _build_full_links(style, study, coverage=None):
+	return create_links_network(None, load_dataset('color_code', study=study), style, graph=network_graph('full_links', study, coverage), study=study)
+
+
+# network name -> (datasets it is built from, builder, published page)
+NETWORKS = {
+	'nytimes': (['nyt'], _build_nytimes, 'nytimes_graph.html'),
+	'full_links': (['tweets_stance', 'color_code'], _build_full_links, 'full_links_graph.html'),
+}
+
+# (study, network name) -> (artifact key, html), only the latest version of each is kept in memory
+_html_cache = OrderedDict()
+# artifact key -> [lock, callers] of the builds of that page in progress, see key_lock
+_building = {}
+_lock = threading.Lock()
+
+
+def artifact_key(name, style=None, study=DEFAULT_STUDY, coverage=None):
+	# content addressed, studies with the same exports share the page
+	datasets = NETWORKS[name][0]
+	style = NETWORK_STYLES[name] if style is None else style
+	payload = {
+		'network': name,
+		'datasets': [dataset_hash(dataset, study) for dataset in datasets],
+		'style': style,
+	}
+	if coverage is not None:
+		payload['coverage'] = coverage
+	return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def build_network_html(name, style=None, study=DEFAULT_STUDY, coverage=None):
+	# coverage keeps only the accounts that produce that share of the engagement, see concentration.py
+	style = NETWORK_STYLES[name] if style is None else style
+	net = NETWORKS[name][1](style, study, coverage)
+	return net.generate_html()
+
+
+def network_html(name, style=None, study=DEFAULT_STUDY, coverage=None):
+	with stage('network_html', network=name, study=study, coverage=coverage) as record:
+		key = artifact_key(name, style, study, coverage)
+
+		with _lock:
+			cached = lru_get(_html_cache, (study, name, coverage))
+		if cached is not None and cached[0] == key:
+			record['source'] = 'memory'
+			return cached[1]
+
+		# pages published to the shared store are read from it on every request rather than
+		# held in this process
+		page = store_page(name, key, study) if coverage is None else None
+		if page is not None:
+			record['source'] = 'store'
+			return page
+
+		# built outside the lock, only the callers of the same page wait for it
+		with key_lock(_building, key, _lock):
+			with _lock:
+				cached = lru_get(_html_cache, (study, name, coverage))
+			if cached is not None and cached[0] == key:
+				record['source'] = 'memory'
+				return cached[1]
+
+			path = artifact_path(key)
+			if os.path.exists(path):
+				record['source'] = 'disk'
+				with open(path, 'r', encoding='utf-8') as f:
+					page = f.read()
+			else:
+				record['source'] = 'build'
+				page = build_network_html(name, style, study, coverage)
+				_write_atomic(path, page)
+
+			with _lock:
+				lru_put(_html_cache, (study, name, coverage), (key, page), 'pages')
+			return page
+
+
+def network_json(name, style=None, study=DEFAULT_STUDY):
+	# compact columnar export for a WebGL renderer such as sigma.js: the pruned graph with positions
+	# computed in python, colours as indices into a palette and edges as pairs of node indices.
+	# there are no tooltips, account_tweets serves the tweets of a node on request
+	style = NETWORK_STYLES[name] if style is None else style
+	style = dict(style, layout=dict(style['layout'], mode='python'))
+	path = artifact_path(artifact_key(name, style, study), '.json')
+	if os.path.exists(path):
+		with open(path, 'r', encoding='utf-8') as f:
+			return f.read()
+
+	net = NETWORKS[name][1](style, study, None)
+	colors = [node.get('color', VIS_NODE_COLOR) for node in net.nodes]
+	palette = {color: i for i, color in enumerate(dict.fromkeys(colors))}
+	position = {node['id']: i for i, node in enumerate(net.nodes)}
+	export = {
+		'directed': net.directed,
+		'palette': list(palette),
+		'nodes': {
+			'label': [node['label'] for node in net.nodes],
+			'x': [round(node['x'], 2) for node in net.nodes],
+			'y': [round(node['y'], 2) for node in net.nodes],
+			'size': [round(node['size'], 2) for node in net.nodes],
+			'color': [palette[color] for color in colors],
+		},
+		'edges': {
+			'source': [position[edge['from']] for edge in net.edges],
+			'target': [position[edge['to']] for edge in net.edges],
+		},
+	}
+	text = json.dumps(export, separators=(',', ':'))
+	_write_atomic(path, text)
+	return text
+
+
+def build_pages(names, out_dir, study=DEFAULT_STUDY, export='html'):
+	for name in names:
+		if export == 'json':
+			filename = os.path.splitext(NETWORKS[name][2])[0] + '.json'
+			_write_atomic(os.path.join(out_dir, filename), network_json(name, study=study))
+			print(f'{name}: {filename}')
+			continue
+
+		key = artifact_key(name, study=study)
+		page = build_network_html(name, study=study)
+		_write_atomic(artifact_path(key), page)
+		_write_atomic(os.path.join(out_dir, NETWORKS[name][2]), page)
+		print(f'{name}: {NETWORKS[name][2]} ({key[:12]})')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Regenerate the network pages of the story ahead of time.')
+	parser.add_argument('networks', nargs='*', help=f'networks to build, one of {", ".join(NETWORKS)} (default: all)')
+	parser.add_argument('--study', default=DEFAULT_STUDY, choices=list(STUDIES))
+	parser.add_argument('--out-dir', default=None, help="directory of the published pages (default: the study's data directory)")
+	parser.add_argument('--format', default='html', choices=['html', 'json'], help='pyvis page, or the compact json of a WebGL renderer')
+	args = parser.parse_args()
+
+	names = args.networks or study_config(args.study)['networks']
+	unknown = [name for name in names if name not in NETWORKS]
+	if unknown:
+		parser.error(f'unknown network: {", ".join(unknown)}')
+
+	build_pages(names, args.out_dir or study_dir(args.study), args.study, args.format)
@@ -0,0 +1,85 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from charts import STORY_CHARTS, study_charts
+from data_loader import DATASETS, dataset_hash, dataset_path, read_dataset
+from networks import artifact_key, network_html
+from store import pa, write_table, write_text
+from studies import DEFAULT_STUDY, study_config
+from timeline import PREPARE, stance_timeline, study_platform, timeline_key, timeline_name
+
+
+# manifest section -> extension of its files in a version of the store
+EXTENSIONS = {'datasets': '.arrow', 'timelines': '.arrow', 'pages': '.html'}
+
+
+def chart_inputs(study=DEFAULT_STUDY):
+	# dataset -> (platform, columns) of every timeline the study's charts are drawn from
+	inputs = {}
+	for name in study_charts(study):
+		dataset, platform, columns = STORY_CHARTS[name][:3]
+		chain = (platform, None if columns is None else tuple(columns))
+		if chain not in inputs.setdefault(dataset, []):
+			inputs[dataset].append(chain)
+	return inputs
+
+
+def expected_keys(study=DEFAULT_STUDY, networks=None):
+	# section -> name -> key of everything a version of the store holds for the data as it is now
+	config = study_config(study)
+	timelines = {}
+	for name, chains in chart_inputs(study).items():
+		for platform, columns in chains:
+			timelines[timeline_name(name, platform, columns)] = timeline_key(dataset_hash(name, study), study_platform(study, platform), columns)
+
+	return {
+		'datasets': {name: dataset_hash(name, study) for name in config['datasets']},
+		'timelines': timelines,
+		'pages': {name: artifact_key(name, study=study) for name in (config['networks'] if networks is None else networks)},
+	}
+
+
+def dataset_task(study, name, staging, write_dataset, chains):
+	# load -> clean -> stance timeline of every chart of one dataset, from a single parse of its csv
+	df = read_dataset(dataset_path(name, study), DATASETS[name])
+	written = {}
+	if write_dataset:
+		write_table(os.path.join(staging, name + '.arrow'), pa.Table.from_pandas(df, preserve_index=False))
+		written['datasets'] = {name: dataset_hash(name, study)}
+
+	for platform, columns in chains:
+		posts = df if columns is None else df[list(columns)]
+		if platform in PREPARE:
+			posts = PREPARE[platform](posts)
+		spec = study_platform(study, platform)
+		timeline = stance_timeline(posts, spec)
+		write_table(os.path.join(staging, timeline_name(name, platform, columns) + '.arrow'), pa.Table.from_pandas(timeline, preserve_index=False))
+		written.setdefault('timelines', {})[timeline_name(name, platform, columns)] = timeline_key(dataset_hash(name, study), spec, columns)
+
+	return written
+
+
+def page_task(study, name, staging):
+	write_text(os.path.join(staging, name + '.html'), network_html(name, study=study))
+	return {'pages': {name: artifact_key(name, study=study)}}
+
+
+def run_pipeline(study, stale, staging, workers=None):
+	# every dataset chain and network page is independent, so each is a task on the pool and a
+	# full refresh takes about as long as the slowest one; stale is section -> name -> key of what
+	# the new version needs written, the keys of what was written are returned
+	inputs = chart_inputs(study)
+	written = {}
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		# the network pages are the slowest, they start first
+		futures = [pool.submit(page_task, study, name, staging) for name in stale.get('pages', {})]
+		for name in study_config(study)['datasets']:
+			chains = [(platform, columns) for platform, columns in inputs.get(name, []) if timeline_name(name, platform, columns) in stale.get('timelines', {})]
+			if name in stale.get('datasets', {}) or chains:
+				futures.append(pool.submit(dataset_task, study, name, staging, name in stale.get('datasets', {}), chains))
+
+		for future in as_completed(futures):
+			for section, keys in future.result().items():
+				written.setdefault(section, {}).update(keys)
+
+	return written
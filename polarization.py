@@ -0,0 +1,140 @@
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from data_loader import STANCES, dataset_hash, load_dataset
+from instrumentation import timed
+from networks import SHARE_GRAPHS
+from studies import DEFAULT_STUDY, STUDIES, cached_build, study_config
+
+
+# nonzeros of the user x user projection held at once, it is multiplied in blocks of users within it
+PROJECTION_BUDGET = 5_000_000
+
+# (study, network name) -> (content hashes of the shares and of the labels, polarization)
+_polarization = OrderedDict()
+# key -> [lock, callers] of the builds in progress, see key_lock
+_building = {}
+_lock = threading.Lock()
+
+
+def incidence_matrix(users, links):
+	# user x link matrix with a one for every link a user shared, however often, and the
+	# users and links of its rows and columns; scipy is imported by the functions that use it, so
+	# importing this module (the story) does not load it
+	from scipy import sparse
+
+	user_codes, user_index = pd.factorize(users)
+	link_codes, link_index = pd.factorize(links)
+	keep = (user_codes >= 0) & (link_codes >= 0)
+	incidence = sparse.csr_matrix((np.ones(int(keep.sum()), dtype=np.int32), (user_codes[keep], link_codes[keep])), shape=(len(user_index), len(link_index)))
+	incidence.data[:] = 1
+	return incidence, user_index, link_index
+
+
+def projection_blocks(incidence, budget=PROJECTION_BUDGET):
+	# the co-sharing projection B B^T as (first row, rows, columns, links shared by both) of blocks of users
+	# whose rows stay within budget nonzeros, without self pairs; rows count from the first row of the block
+	link_users = np.asarray(incidence.sum(axis=0)).ravel()
+	# users reached from every user through its links, a bound on the nonzeros of its row
+	cost = np.cumsum(incidence @ link_users)
+	transposed = incidence.T.tocsr()
+	start = 0
+	while start < incidence.shape[0]:
+		stop = max(int(np.searchsorted(cost, (cost[start - 1] if start else 0) + budget, side='right')), start + 1)
+		block = (incidence[start:stop] @ transposed).tocoo()
+		keep = block.row != block.col - start
+		yield start, block.row[keep], block.col[keep], block.data[keep]
+		start = stop
+
+
+def stance_codes(users, labels):
+	# position in STANCES of every user's accuracy ratio, -1 without one
+	labels = labels.drop_duplicates('username', keep='last')
+	codes = pd.Categorical(labels['accuracy_ratio'], categories=STANCES).codes
+	positions = pd.Index(labels['username']).get_indexer(users)
+	return np.where(positions >= 0, codes[np.maximum(positions, 0)], -1)
+
+
+def weighted_mixing(incidence, codes):
+	# stance x stance sum of the projection's weights, as S^T B B^T S from the per-link stance counts
+	# B^T S, so the projection itself is never built; labelled users only
+	from scipy import sparse
+
+	labelled = np.flatnonzero(codes >= 0)
+	onehot = sparse.csr_matrix((np.ones(len(labelled)), (labelled, codes[labelled])), shape=(len(codes), len(STANCES)))
+	per_link = (incidence.T @ onehot).toarray()
+	# the diagonal of B B^T pairs every user with itself once per link it shared
+	degrees = np.asarray(incidence.sum(axis=1)).ravel()
+	return per_link.T @ per_link - np.diag(np.bincount(codes[labelled], weights=degrees[labelled], minlength=len(STANCES)))
+
+
+def tie_mixing(incidence, codes, budget=PROJECTION_BUDGET):
+	# stance x stance count of the pairs of labelled users that shared at least one link
+	size = len(STANCES)
+	mixing = np.zeros((size, size))
+	for start, rows, columns, _ in projection_blocks(incidence, budget):
+		first, second = codes[start:][rows], codes[columns]
+		both = (first >= 0) & (second >= 0)
+		mixing += np.bincount(first[both] * size + second[both], minlength=size * size).reshape(size, size)
+	return mixing
+
+
+def mixing_metrics(mixing):
+	# polarization of an undirected graph from its stance mixing matrix, every edge counted from both ends:
+	# within is the share of edges inside a stance and expected that share if edges ignored the stances
+	total = mixing.sum()
+	if not total:
+		return {'edges': 0.0, 'cross_share': np.nan, 'expected_cross_share': np.nan, 'ei_index': np.nan, 'assortativity': np.nan, 'modularity': np.nan}
+	shares = mixing / total
+	within = np.trace(shares)
+	expected = float((shares.sum(axis=1) ** 2).sum())
+	return {
+		'edges': float(total / 2),
+		'cross_share': float(1 - within),
+		'expected_cross_share': 1 - expected,
+		# (external - internal) / (external + internal)
+		'ei_index': float(1 - 2 * within),
+		'assortativity': float((within - expected) / (1 - expected)) if expected < 1 else np.nan,
+		'modularity': float(within - expected),
+	}
+
+
+@timed()
+def network_polarization(name, study=DEFAULT_STUDY):
+	# co-sharing polarization of the accounts of a network, labelled with their accuracy ratio; ties
+	# count every pair of accounts that shared a link once, weighted counts it per link shared
+	dataset = SHARE_GRAPHS[name][0]
+	digests = (dataset_hash(dataset, study), dataset_hash('color_code', study))
+
+	def build():
+		shares = load_dataset(dataset, ['username', 'original_link'], study)
+		incidence, users, links = incidence_matrix(shares['username'].to_numpy(), shares['original_link'].to_numpy())
+		codes = stance_codes(users, load_dataset('color_code', ['username', 'accuracy_ratio'], study))
+		ties = tie_mixing(incidence, codes)
+		return {
+			'users': len(users),
+			'labelled': int((codes >= 0).sum()),
+			'links': len(links),
+			'mixing': pd.DataFrame(ties, index=STANCES, columns=STANCES),
+			'ties': mixing_metrics(ties),
+			'weighted': mixing_metrics(weighted_mixing(incidence, codes)),
+		}
+
+	return cached_build(_polarization, _building, _lock, (study, name), digests, build, 'polarization')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Measure how polarized the co-sharing of the story networks is.')
+	parser.add_argument('networks', nargs='*', help=f'networks to measure, from {", ".join(SHARE_GRAPHS)} (default: all of the study)')
+	parser.add_argument('--study', default=DEFAULT_STUDY, choices=list(STUDIES))
+	args = parser.parse_args()
+
+	for name in args.networks or study_config(args.study)['networks']:
+		polarization = network_polarization(name, args.study)
+		print(f"{name}: {polarization['labelled']} of {polarization['users']} accounts labelled, {polarization['links']} links")
+		for kind in ('ties', 'weighted'):
+			print(f'  {kind}: ' + ', '.join(f'{metric} {value:.3f}' for metric, value in polarization[kind].items()))
@@ -0,0 +1,61 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from charts import STORY_CHARTS, story_chart, study_charts
+from networks import NETWORKS, network_html
+from studies import DEFAULT_STUDY, STUDIES, study_config
+
+
+def render_chart(name, out_dir, study=DEFAULT_STUDY):
+	chart = story_chart(name, study)
+	json_path = os.path.join(out_dir, f'{name}.vl.json')
+	html_path = os.path.join(out_dir, f'{name}.html')
+	with open(json_path, 'w', encoding='utf-8') as f:
+		f.write(chart.to_json())
+	chart.save(html_path)
+	return [json_path, html_path]
+
+
+def render_network(name, out_dir, study=DEFAULT_STUDY):
+	path = os.path.join(out_dir, NETWORKS[name][2])
+	with open(path, 'w', encoding='utf-8') as f:
+		f.write(network_html(name, study=study))
+	return [path]
+
+
+def render_story(out_dir, charts=None, networks=None, workers=None, study=DEFAULT_STUDY):
+	os.makedirs(out_dir, exist_ok=True)
+	charts = study_charts(study) if charts is None else charts
+	networks = study_config(study)['networks'] if networks is None else networks
+
+	# every chart and network is independent, so each one is its own task
+	written = []
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		futures = [pool.submit(render_network, name, out_dir, study) for name in networks]
+		futures += [pool.submit(render_chart, name, out_dir, study) for name in charts]
+		for future in as_completed(futures):
+			written.extend(future.result())
+
+	return sorted(written)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Render every chart and network of the story without Streamlit.')
+	parser.add_argument('--study', default=DEFAULT_STUDY, choices=list(STUDIES))
+	parser.add_argument('--out-dir', default='story_artifacts')
+	parser.add_argument('--workers', type=int, default=None, help='size of the process pool (default: number of CPUs)')
+	parser.add_argument('--charts', nargs='*', default=None, help=f'charts to render, from {", ".join(STORY_CHARTS)} (default: all)')
+	parser.add_argument('--networks', nargs='*', default=None, help=f'networks to render, from {", ".join(NETWORKS)} (default: all)')
+	args = parser.parse_args()
+
+	unknown = [name for name in args.charts or [] if name not in STORY_CHARTS]
+	unknown += [name for name in args.networks or [] if name not in NETWORKS]
+	if unknown:
+		parser.error(f'unknown chart or network: {", ".join(unknown)}')
+
+	start = time.perf_counter()
+	for path in render_story(args.out_dir, args.charts, args.networks, args.workers, args.study):
+		print(path)
+	print(f'rendered in {time.perf_counter() - start:.1f}s')
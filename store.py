@@ -0,0 +1,214 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from studies import DEFAULT_STUDY, STUDIES, lru_get, lru_put
+
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+try:
+	import pyarrow as pa
+	import pyarrow.ipc as ipc
+except ImportError:
+	pa = None
+
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.store')
+
+# versions kept besides the current one, so readers that mapped them before a publish can finish
+KEEP_VERSIONS = 2
+
+# <store>/<study>/versions/<version>/ holds the arrow file of every dataset and chart timeline, the
+# network pages and manifest.json with the keys they were built from. a version is never
+# modified once published, <store>/<study>/CURRENT names the one readers use and is swapped with
+# os.replace, and publishing is serialized by an flock on <store>/<study>/LOCK
+
+# study -> (inode and mtime of CURRENT, version, manifest)
+_current = {}
+# path -> arrow table whose buffers are the memory map of the file
+_tables = OrderedDict()
+_lock = threading.Lock()
+
+
+def study_store(study=DEFAULT_STUDY):
+	return os.path.join(STORE_DIR, study)
+
+
+def version_dir(study, version):
+	return os.path.join(study_store(study), 'versions', version)
+
+
+def current_version(study=DEFAULT_STUDY):
+	# (version, manifest) readers should use, (None, {}) before the first publish
+	pointer = os.path.join(study_store(study), 'CURRENT')
+	try:
+		stat = os.stat(pointer)
+	except FileNotFoundError:
+		return None, {}
+	signature = (stat.st_ino, stat.st_mtime_ns)
+
+	with _lock:
+		cached = _current.get(study)
+		if cached is not None and cached[0] == signature:
+			return cached[1], cached[2]
+
+	try:
+		with open(pointer, 'r', encoding='utf-8') as f:
+			version = f.read().strip()
+		with open(os.path.join(version_dir(study, version), 'manifest.json'), 'r', encoding='utf-8') as f:
+			manifest = json.load(f)
+	except FileNotFoundError:
+		return None, {}
+
+	with _lock:
+		_current[study] = (signature, version, manifest)
+	return version, manifest
+
+
+def store_table(name, key, study=DEFAULT_STUDY, section='datasets'):
+	# the published table of a dataset or timeline while it was built from key. the file is memory-mapped,
+	# so every worker on the host shares its pages through the page cache instead of a heap copy
+	version, manifest = current_version(study)
+	if pa is None or manifest.get(section, {}).get(name) != key:
+		return None
+
+	path = os.path.join(version_dir(study, version), name + '.arrow')
+	with _lock:
+		table = lru_get(_tables, path)
+	if table is not None:
+		return table
+
+	# mapped outside the lock, a second map of the same file by a concurrent caller costs no copy
+	try:
+		table = ipc.open_file(pa.memory_map(path)).read_all()
+	except FileNotFoundError:
+		# pruned by a publish since CURRENT was read
+		return None
+	with _lock:
+		lru_put(_tables, path, table, 'tables')
+	return table
+
+
+def store_page(name, key, study=DEFAULT_STUDY):
+	# a published network page while it matches key; read per request and not kept, so the
+	# pages are not held once per process
+	version, manifest = current_version(study)
+	if manifest.get('pages', {}).get(name) != key:
+		return None
+
+	try:
+		with open(os.path.join(version_dir(study, version), name + '.html'), 'r', encoding='utf-8') as f:
+			return f.read()
+	except FileNotFoundError:
+		return None
+
+
+@contextmanager
+def file_lock(path):
+	# exclusive flock on path, held across processes until the block exits
+	with open(path, 'a') as f:
+		if fcntl is not None:
+			fcntl.flock(f, fcntl.LOCK_EX)
+		try:
+			yield
+		finally:
+			if fcntl is not None:
+				fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def writer_lock(study=DEFAULT_STUDY):
+	os.makedirs(study_store(study), exist_ok=True)
+	return file_lock(os.path.join(study_store(study), 'LOCK'))
+
+
+def write_table(path, table):
+	# uncompressed so readers can map it without decoding
+	with ipc.new_file(path, table.schema) as writer:
+		writer.write_table(table)
+
+
+def write_text(path, text):
+	with open(path, 'w', encoding='utf-8') as f:
+		f.write(text)
+		f.flush()
+		os.fsync(f.fileno())
+
+
+def _reuse(study, previous, manifest, section, name, key, extension, staging):
+	# unchanged files are hard links into the previous version, not copies
+	if previous is None or manifest.get(section, {}).get(name) != key:
+		return False
+	try:
+		os.link(os.path.join(version_dir(study, previous), name + extension), os.path.join(staging, name + extension))
+	except OSError:
+		return False
+	return True
+
+
+def _prune(study, keep):
+	versions = os.path.join(study_store(study), 'versions')
+	entries = sorted(os.scandir(versions), key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+	published = [entry for entry in entries if not entry.name.endswith('.tmp')]
+	for entry in [entry for entry in entries if entry.name.endswith('.tmp')] + published[KEEP_VERSIONS + 1:]:
+		if entry.name not in keep:
+			shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def publish(study=DEFAULT_STUDY, networks=None, workers=None):
+	# the single writer: builds a new version next to the published ones and swaps CURRENT to it
+	if pa is None:
+		raise ImportError('pyarrow is required to publish the artifact store')
+
+	# imported here, the modules of the pipeline read from this one
+	from pipeline import EXTENSIONS, expected_keys, run_pipeline
+
+	with writer_lock(study):
+		previous, manifest = current_version(study)
+		keys = expected_keys(study, networks)
+		contents = json.dumps(keys, sort_keys=True)
+		version = hashlib.sha256(contents.encode('utf-8')).hexdigest()[:16]
+		if version == previous:
+			return version
+
+		target = version_dir(study, version)
+		if not os.path.isdir(target):
+			staging = f'{target}.{os.getpid()}.tmp'
+			shutil.rmtree(staging, ignore_errors=True)
+			os.makedirs(staging)
+
+			stale = {}
+			for section, names in keys.items():
+				for name, key in names.items():
+					if not _reuse(study, previous, manifest, section, name, key, EXTENSIONS[section], staging):
+						stale.setdefault(section, {})[name] = key
+
+			# the tasks return the keys of what they wrote, which differ if the data changed meanwhile
+			if run_pipeline(study, stale, staging, workers) != stale:
+				raise RuntimeError(f'the data of {study} changed while it was published, publish again')
+
+			write_text(os.path.join(staging, 'manifest.json'), contents)
+			os.replace(staging, target)
+
+		pointer = os.path.join(study_store(study), 'CURRENT')
+		write_text(f'{pointer}.{os.getpid()}.tmp', version)
+		os.replace(f'{pointer}.{os.getpid()}.tmp', pointer)
+		_prune(study, {version, previous})
+		return version
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Publish the datasets and network pages of a study to the shared artifact store.')
+	parser.add_argument('--study', default=DEFAULT_STUDY, choices=list(STUDIES))
+	parser.add_argument('--networks', nargs='*', default=None, help='network pages to publish (default: all of the study)')
+	parser.add_argument('--workers', type=int, default=None, help='size of the process pool (default: number of CPUs)')
+	args = parser.parse_args()
+
+	print(f'{args.study}: {publish(args.study, args.networks, args.workers)}')
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from data_loader import dataset_hash
+from instrumentation import timed
+from pipeline import chart_inputs
+from studies import DEFAULT_STUDY, cached_build, study_config
+from timeline import PLATFORMS, dataset_timeline
+
+try:
+	import pyarrow as pa
+except ImportError:
+	pa = None
+
+
+# study -> (content hashes of the charted datasets, statistics of each)
+_stats = OrderedDict()
+# key -> [lock, callers] of the builds in progress, see key_lock
+_building = {}
+_lock = threading.Lock()
+
+
+def aggregate(timeline, metrics, events, outlets):
+	# posts and the sum of every metric per stance, period between the event days and outlet code, in one
+	# grouped pass over the chart rows; every figure of the narrative is a sum of its few rows
+	cuts = np.array(sorted(pd.Timestamp(day) for day in events.values()), dtype='datetime64[ns]')
+	# arrow strings are searched in C, object ones one row at a time
+	links = timeline['link'] if pa is None else timeline['link'].astype(pd.StringDtype('pyarrow'))
+	outlet = np.zeros(len(timeline), dtype='int8')
+	for code, domain in enumerate(outlets.values(), 1):
+		outlet[links.str.contains(domain, regex=False).fillna(False).to_numpy(dtype=bool)] = code
+	return pd.DataFrame({
+		'stance': timeline['stance'].to_numpy(),
+		'period': np.searchsorted(cuts, timeline['day'].to_numpy(), side='right'),
+		'outlet': outlet,
+		'posts': 1,
+		**{metric: timeline[metric].to_numpy() for metric in metrics},
+	}).groupby(['stance', 'period', 'outlet'], observed=True).sum()
+
+
+def by_stance(groups):
+	# stance -> posts and the sum of every metric
+	return {stance: {key: int(value) for key, value in totals.items()} for stance, totals in groups.groupby(level='stance').sum().iterrows()}
+
+
+def summarize(groups, events, outlets):
+	# period p holds the days on or after the first p events, so "before" an event is every period up to its position
+	order = sorted(events, key=lambda event: pd.Timestamp(events[event]))
+	period = groups.index.get_level_values('period')
+	outlet = groups.index.get_level_values('outlet')
+	return {
+		'stances': by_stance(groups),
+		'before': {event: by_stance(groups[period <= position]) for position, event in enumerate(order)},
+		'after': {event: by_stance(groups[period > position]) for position, event in enumerate(order)},
+		'outlets': {name: by_stance(groups[outlet == code]) for code, name in enumerate(outlets, 1)},
+	}
+
+
+@timed()
+def story_stats(study=DEFAULT_STUDY):
+	# dataset -> statistics of the rows its charts plot, computed once per version of the data
+	inputs = {name: chains[0] for name, chains in chart_inputs(study).items()}
+	digests = tuple(dataset_hash(name, study) for name in inputs)
+
+	def build():
+		config = study_config(study)
+		events, outlets = config.get('events', {}), config.get('outlets', {})
+		stats = {}
+		for name, (platform, columns) in inputs.items():
+			timeline = dataset_timeline(name, platform, columns, study)
+			stats[name] = summarize(aggregate(timeline, PLATFORMS[platform]['metrics'], events, outlets), events, outlets)
+		return stats
+
+	return cached_build(_stats, _building, _lock, study, digests, build, 'stats')
+
+
+def total(stances, key):
+	return sum(values.get(key, 0) for values in stances.values())
+
+
+def ratio(stances, key, numerator='misleading', denominator='nuanced_accurate'):
+	bottom = stances.get(denominator, {}).get(key, 0)
+	return stances.get(numerator, {}).get(key, 0) / bottom if bottom else float('nan')
+
+
+def share(stances, key, stance='misleading'):
+	whole = total(stances, key)
+	return stances.get(stance, {}).get(key, 0) / whole if whole else 0.0
+
+
+def percent(value):
+	return f'{100 * value:.0f} percent'
+
+
+def rounded(value):
+	# how the narrative writes engagement: 32 million, 2.5 million, 158,000, 927
+	if value >= 10_000_000:
+		return f'{value / 1_000_000:.0f} million'
+	if value >= 1_000_000:
+		return f'{value / 1_000_000:.1f} million'
+	if value >= 10_000:
+		return f'{round(value, -3):,.0f}'
+	return f'{value:,}'
@@ -1,81 +1,130 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import json
-import streamlit.components.v1 as components
-import altair as alt
-import networkx as nx
-from pyvis.network import Network
 from streamlit.components.v1 import html
-import community as community_louvain
-import matplotlib.cm as cm
-import re
-from collections import defaultdict
+from charts import STORY_CHARTS, TWEET_CHART_COLUMNS, YOUTUBE_CHART_COLUMNS, facebook_chart, lorenz_chart, story_chart, study_charts, tweets_chart, youtube_chart
+from concentration import ENGAGEMENT, concentration_summary, dataset_concentration, filter_dataset
+from instrumentation import debug_enabled, enable_memory_tracing, enable_stage_logging, payload_size, records, stage, start_run
+from links import story_engagement
+from networks import account_tweets, network_html
+from polarization import network_polarization
+from story_stats import percent, ratio, rounded, share, story_stats, total
+from studies import DEFAULT_STUDY, STUDIES, study_config
+from time_index import dataset_time_index, day_range, window_ratios, window_timeline, window_totals
+from timeline import dataset_timeline, stance_timeline, study_platform
 
 
 st.set_page_config(layout="wide", initial_sidebar_state="expanded")
 
-# path = "/Users/rorysmith/Desktop/cochrane_app/"
-
-def create_stance_dataframes(df):
-	stances = ['neutral', 'misleading', 'nuanced_accurate']
-
-	df = df[df.notes.isna()]
-
-	df = df[df.day >= "2023-01-29"]
-
-	stance_dataframes = {}
-
-	for stance in stances:
-		stance_df = df[df['stance'] == stance]
-		stance_df = stance_df.sort_values(by='day', ascending=True)
-		# cumsum both retweets and impressions
-		stance_df['retweets_cumulative'] = stance_df.retweets.cumsum()
-		stance_df['impressions_cumulative'] = stance_df.impressions.cumsum()
-
-		stance_dataframes[stance] = stance_df
-
-	return stance_dataframes
-
-def select_size(y_axis):
-	if y_axis == "retweets_cumulative":
-		return "retweets"
-	else:
-		return "impressions"
-
-def scatter(df):
-	df_dict = create_stance_dataframes(df)
-
-	df_accurate = df_dict['nuanced_accurate'].copy()
-	df_accurate['label'] = 'Accurate'
+# ?debug=1 (or STORY_DEBUG=1) shows the per-stage timings of this rerun in the sidebar. memory is
+# only traced, and the stages logged to stderr, with STORY_DEBUG: both are process wide
+debug = debug_enabled() or st.query_params.get('debug') == '1'
+if debug_enabled():
+	enable_memory_tracing()
+	enable_stage_logging()
+start_run()
 
-	df_misleading = df_dict['misleading'].copy()
-	df_misleading['label'] = 'Misleading'
-
-	combined_df = pd.concat([df_accurate, df_misleading], ignore_index=True)
-
-	color_scale = alt.Scale(
-		domain=["Accurate", "Misleading"],
-		range=["#32CD32", "#FF7F7F"]
-	)
-
-
-	# Create the combined chart
-	combined_chart = alt.Chart(combined_df, width=1200, height=700).mark_circle().encode(
-		x="day:T",
-		y=alt.Y(f'{y_axis}:Q', axis=alt.Axis(title=y_axis.capitalize())),
-		size=alt.Size(f'{select_size(y_axis)}:Q', legend=None),
-		tooltip=['link:N', f'{select_size(y_axis)}:Q', 'day:T'],
-		href='link',
-		color=alt.Color('label:N', scale=color_scale, legend=alt.Legend(title="Stances"))
-	).interactive()
+# ?study=<name> picks the case study, every study shares the caches of this worker
+study = st.query_params.get('study', DEFAULT_STUDY)
+if study not in STUDIES:
+	st.error(f'Unknown study: {study}')
+	st.stop()
 
+# path = "/Users/rorysmith/Desktop/cochrane_app/"
 
-	combined_chart['usermeta'] = {
-		"embedOptions": {
-			'loader': {'target': '_blank'}
-		}
-	}
+def show_chart(chart, name):
+	with stage('send chart', chart=name) as record:
+		if debug:
+			record['payload_bytes'] = payload_size(chart)
+		return st.altair_chart(chart)
+
+def show_network(name, coverage=None):
+	page = network_html(name, study=study, coverage=coverage)
+	with stage('send network', network=name, payload_bytes=payload_size(page)):
+		return html(page, height=900, width=1000)
+
+def show_polarization(name):
+	# how seldom accounts of different stances shared the same links, measured on the co-sharing projection
+	ties = network_polarization(name, study)['ties']
+	st.caption(f"{ties['edges']:,.0f} pairs of labelled accounts shared at least one link, {ties['cross_share']:.1%} of them across stances \
+		({ties['expected_cross_share']:.1%} if accounts paired up regardless of stance). E-I index {ties['ei_index']:.2f}, stance assortativity {ties['assortativity']:.2f}, \
+		modularity of the split by stance {ties['modularity']:.2f}.")
+
+def show_account_tweets(name):
+	# the tooltips list the first tweets of an account, the rest are only looked up when asked for
+	username = st.text_input("Every tweet of an account in this network", key=f'{name} account', placeholder='username')
+	if username:
+		tweets = account_tweets(name, username.strip().lstrip('@'), study)
+		st.markdown('\n'.join(f'- {tweet}' for tweet in tweets) if tweets else f'No tweets from {username} in this network.')
+
+def engagement_share(name):
+	return st.slider("Share of engagement (%)", min_value=10, max_value=100, value=80, step=5, key=f'{name} share') / 100
+
+def explore_concentration(dataset, platform, columns, name):
+	# the thresholds of the pre-filtered exports, recomputed from the posts for any share of engagement
+	with st.expander("Explore how concentrated the engagement is", key=f'{name} concentration', on_change='rerun') as explorer:
+		if not explorer.open:
+			return
+		with stage('section: concentration', dataset=dataset):
+			coverage = engagement_share(name)
+			summary = concentration_summary(dataset, coverage, study)
+			st.write(f"{summary['covering_share']:.1%} of accounts ({summary['covering_accounts']} of {summary['accounts']}) produced {coverage:.0%} of the "
+				f"{ENGAGEMENT[dataset][1]} in this dataset. The Gini coefficient of engagement across accounts is {summary['gini']:.2f}.")
+			show_chart(lorenz_chart(dataset_concentration(dataset, study)['lorenz'], coverage), f'{name} lorenz')
+
+			timeline = stance_timeline(filter_dataset(dataset, coverage, columns, study), study_platform(study, platform))
+			if platform == 'twitter':
+				scatter(timeline, f'{name} top accounts')
+			else:
+				show_chart(facebook_chart(timeline), f'{name} top accounts')
+
+def windowed(dataset, platform, columns=None):
+	# the chart rows inside the sidebar's date range, sliced from the time index instead of refiltered
+	timeline = dataset_timeline(dataset, platform, columns, study)
+	return window_timeline(timeline, dataset_time_index(dataset, platform, columns, study), window_start, window_end)
+
+def window_caption(dataset, platform, columns=None):
+	totals = window_totals(dataset_time_index(dataset, platform, columns, study), window_start, window_end)
+	ratios = ', '.join(f'{ratio:.1f}x the {key}' for key, ratio in window_ratios(totals).items() if ratio is not None)
+	counts = ' and '.join(f"{totals.get(stance, {}).get('posts', 0)} {label.lower()}" for stance, label in study_config(study)['stances'].items())
+	st.caption(f"{window_start:%B %d} to {window_end - pd.Timedelta(days=1):%B %d, %Y}: {counts} posts. Misleading compared with accurate: {ratios or 'no accurate posts'}.")
+
+def section(label, expanded=True):
+	# the body of a section only runs while it is open: a collapsed chart or network is not
+	# computed on any rerun, and the networks start collapsed so the text never waits on them
+	return st.expander(label, expanded=expanded, key=f'section {label}', on_change='rerun')
+
+def date_window():
+	# one date range for every stance chart, answered from the per-stance time indexes
+	chart_inputs = {(dataset, platform, columns and tuple(columns)) for dataset, platform, columns, *_ in map(STORY_CHARTS.get, study_charts(study))}
+	first_day, last_day = day_range(study, chart_inputs)
+	date_range = st.sidebar.slider("Date range", min_value=first_day.date(), max_value=last_day.date(), value=(first_day.date(), last_day.date()))
+	return pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)
+
+def show_timings():
+	if debug:
+		st.sidebar.header('Stage timings')
+		st.sidebar.dataframe(pd.DataFrame(records()))
+
+if study != DEFAULT_STUDY:
+	# the narrative below is written for the Cochrane review, other studies get their charts and networks in order
+	with st.columns((1, 2, 1))[1]:
+		st.title(study_config(study)['title'])
+	window_start, window_end = date_window()
+	for name in study_charts(study):
+		with section(name) as chart_section:
+			if chart_section.open:
+				show_chart(story_chart(name, study, window_start, window_end), name)
+	for name in study_config(study)['networks']:
+		with section(f'{name} network', expanded=False) as network_section:
+			if network_section.open:
+				show_network(name)
+				show_polarization(name)
+				show_account_tweets(name)
+	show_timings()
+	st.stop()
+
+def scatter(df, name):
+	combined_chart = tweets_chart(df, y_axis)
 
 # 	combined_chart = combined_chart.properties(
 #     autosize=alt.AutoSizeParams(
@@ -101,174 +150,12 @@ def scatter(df):
 		)
 		# st.altair_chart(scatter(news_coverage, stances))
 
-		return st.altair_chart(combined_chart)
-
-def create_stance_dataframes_youtube(df):
-	stances = ['misleading', 'nuanced_accurate']
-
-	df = df[df.day >= "2023-01-29"]
-
-	stance_dataframes = {}
-	
-	for stance in stances:
-		stance_df = df[df['stance'] == stance]
-		stance_df = stance_df.sort_values(by='day', ascending=True)
-		# cumsum both retweets and impressions
-		stance_df['views_cumulative'] = stance_df.views.cumsum()
-
-		stance_dataframes[stance] = stance_df
-
-	return stance_dataframes
-
-
-def scatter_youtube(df):
-	df_dict = create_stance_dataframes_youtube(df)
-
-	df_accurate = df_dict['nuanced_accurate'].copy()
-	df_accurate['label'] = 'Accurate'
-
-	df_misleading = df_dict['misleading'].copy()
-	df_misleading['label'] = 'Misleading'
-
-	combined_df = pd.concat([df_accurate, df_misleading], ignore_index=True)
-
-	color_scale = alt.Scale(
-		domain=["Accurate", "Misleading"],
-		range=["#32CD32", "#FF7F7F"]
-	)
-
-
-	# Create the combined chart
-	combined_chart = alt.Chart(combined_df, width=1200, height=700).mark_circle().encode(
-		x="day:T",
-		y="views_cumulative:Q",
-		size=alt.Size("views:Q", legend=None),
-		tooltip=['channel_title:N','link:N', "views:Q", 'day:T'],
-		href='link',
-		color=alt.Color('label:N', scale=color_scale, legend=alt.Legend(title="Stances"))
-	).interactive()
-
-
-	combined_chart['usermeta'] = {
-		"embedOptions": {
-			'loader': {'target': '_blank'}
-		}
-	}
-
-	return st.altair_chart(combined_chart)
-
-
-def create_stance_dataframes_facebook(df):
-	stances = ['misleading', 'nuanced_accurate']
-
-	df = df[df.day >= "2023-01-29"]
-
-	stance_dataframes = {}
-	
-	for stance in stances:
-		stance_df = df[df['stance'] == stance]
-		stance_df = stance_df.sort_values(by='day', ascending=True)
-		# cumsum both retweets and impressions
-		stance_df['interactions_cumulative'] = stance_df.interactions.cumsum()
-
-		stance_dataframes[stance] = stance_df
-
-	return stance_dataframes
-
-
-def scatter_facebook(df):
-	df_dict = create_stance_dataframes_facebook(df)
-
-	df_accurate = df_dict['nuanced_accurate'].copy()
-	df_accurate['label'] = 'Accurate'
-
-	df_misleading = df_dict['misleading'].copy()
-	df_misleading['label'] = 'Misleading'
-
-	combined_df = pd.concat([df_accurate, df_misleading], ignore_index=True)
-
-	color_scale = alt.Scale(
-		domain=["Accurate", "Misleading"],
-		range=["#32CD32", "#FF7F7F"]
-	)
-
-
-	tooltip_list = ['link:N', "interactions:Q", 'day:T']
-
-	# Check if 'name' column exists in the DataFrame
-	if 'name' in combined_df.columns:
-		tooltip_list.insert(0, 'name:N')
-
-	# Create the combined chart
-	combined_chart = alt.Chart(combined_df, width=1200, height=700).mark_circle().encode(
-		x="day:T",
-		y="interactions_cumulative:Q",
-		size=alt.Size("interactions:Q", legend=None),
-		tooltip=tooltip_list,
-		href='link',
-		color=alt.Color('label:N', scale=color_scale, legend=alt.Legend(title="Stances"))
-	).interactive()
-
-
-	combined_chart['usermeta'] = {
-		"embedOptions": {
-			'loader': {'target': '_blank'}
-		}
-	}
-
-	return st.altair_chart(combined_chart)
-
-
-def create_network(df):
-	G = nx.Graph()
-
-	# Create dictionaries to store all tweets and cumulative retweets for each username
-	tweets_by_username = {}
-	retweets_by_username = {}
-
-	for index, row in nyt.iterrows():
-		username = row['username']
-		retweets = row['retweets']
-		tweet = row['tweet']
-
-		if username in tweets_by_username:
-			tweets_by_username[username].append(tweet)
-			retweets_by_username[username] += retweets
-		else:
-			tweets_by_username[username] = [tweet]
-			retweets_by_username[username] = retweets
-
-		G.add_node(username)
-		G.add_edge(username, row['original_link'])
-
-	net = Network(height='700px', width='1200px', notebook=True, bgcolor='#222222', font_color='white')
-
-
-	net.from_nx(G)
-	net.barnes_hut(overlap=1)
-	net.repulsion(node_distance=800, central_gravity=0.01, spring_length=150)
-
-	partition = community_louvain.best_partition(G)
-	unique_communities = len(set(partition.values()))
-	color_mapping = {0: "#32CD32", 1: "#FF7F7F"}
-
-	for node in net.nodes:
-		community_id = partition[node['id']]
-		node['color'] = color_mapping[community_id]
-		username = node['id']
-		node['size'] = retweets_by_username.get(username, 0) / 10
-		all_tweets = tweets_by_username.get(username, [])
-		formatted_tweets = "<br>".join([f'<a href="{t}" target="_blank">{t}</a>' for t in all_tweets])
-		node['title'] = f"Username: {username}<br>{formatted_tweets}"
-		
-			
-
-	return net
+		return show_chart(combined_chart, name)
 
 content_column_1 = st.columns((1, 2, 1))[1]
 
 # Add a header and a text paragraph under the title within the centered column
-with content_column_1:
+with content_column_1, stage('section: introduction'):
 	st.title('Masking the Truth: How a Cochrane Study Got Entangled in a Web of Misinterpretation')
 	st.header('A Cochrane meta-analysis examining the efficacy of masks in protecting against Covid-19 became a focal point for misleading narratives.')
 	st.write("The Covid-19 pandemic caused an explosion of new information, some based on scientific research that had received peer-review, some published immediately to help advance knowledge \
@@ -301,7 +188,11 @@ with content_column_1:
     	[a statement by Cochrane](https://www.cochrane.org/news/statement-physical-interventions-interrupt-or-reduce-spread-respiratory-viruses-review), which underlined how the results of the \
      	study were inconclusive, as well as [another New York Times op-ed](https://www.nytimes.com/2023/03/10/opinion/masks-work-cochrane-study.html) discussing that statement were issued but they \
       	had little impact on the spread of misleading content on Facebook and Twitter.", unsafe_allow_html=True)
-	st.write("Nonetheless, by the time the statement and second op-ed were published, inaccurate versions of the study findings had received at least 27 million impressions on Twitter, several million \
+	# the figures of the narrative, from the charted rows and computed once per version of the data
+	stats = story_stats(study)
+	tweets, posts, videos = stats['top_tweets'], stats['facebook_top_posts'], stats['youtube']
+	twitter_stories, facebook_stories = stats['news_stories'], stats['news_stories_facebook']
+	st.write(f"Nonetheless, by the time the statement and second op-ed were published, inaccurate versions of the study findings had received at least {rounded(tweets['before']['cochrane_statement']['misleading']['impressions'])} impressions on Twitter, several million \
 	views on YouTube, and tens of thousands of interactions on Facebook across multiple languages.")
 	st.write("In this case study, we track the spread of content, including media reports, related to the findings of the Cochrane study on Twitter, Facebook and YouTube. It shows how poorly worded \
   	communications products can result in misleading coverage. In our networked information ecosystem, clarifying statements or corrections stand little chance of being effective, particularly on \
@@ -319,49 +210,49 @@ with content_column_1:
 content_column_2 = st.columns((1, 2, 1))[1]
 
 # Add a header and a text paragraph under the title within the centered column
-with content_column_2:
+with content_column_2, stage('section: methodology'):
 	st.header('Methodology')
 	st.write("For analyzing social media conversations, we gathered all the tweets, posts and videos that included the words cochrane and mask between January 29, 2023 and April 1, 2023, using the \
  	APIs of Twitter, Facebook and YouTube. The data resulted in thousands of tweets and posts. Because of this, we opted to focus on those tweets and posts that generated 80 percent of the retweets \
   	(Twitter) and interactions (Facebook). Focusing on high-engagement posts allows us to capture accounts that [make up a disproportionately large share of content views and generally have an \
    	outsized impact](https://healthfeedback.org/misinformation-superspreaders-thriving-on-musk-owned-twitter/) on social media conversations.")
-	st.write("To analyze news media coverage, we used the media analytics platform Meltwater (searching for the combination of *mask* AND *cochrane*) and scraped Altmetric (an analytics platform that \
- 	tracks mentions of academic articles on the web). We gathered 152 news stories and Substack articles published between January 29 and April 1, 2023 addressing the Cochrane study.")
+	st.write(f"To analyze news media coverage, we used the media analytics platform Meltwater (searching for the combination of *mask* AND *cochrane*) and scraped Altmetric (an analytics platform that \
+ 	tracks mentions of academic articles on the web). We gathered {total(twitter_stories['stances'], 'posts')} news stories and Substack articles published between January 29 and April 1, 2023 addressing the Cochrane study.")
 	
 
 content_column_3 = st.columns((1, 2, 1))[1]
-with content_column_3:
+with content_column_3, stage('section: findings'):
 	st.header('Findings')
 	st.subheader("Misleading Content and Media Stories Dominate Facebook and Twitter Engagement")
-	st.write("Of the 152 news stories we identified, 70 percent provided an incomplete analysis of the actual findings of the study or misrepresented them altogether. In such cases, \
+	st.write(f"Of the {total(twitter_stories['stances'], 'posts')} news stories we identified, {percent(share(twitter_stories['stances'], 'posts'))} provided an incomplete analysis of the actual findings of the study or misrepresented them altogether. In such cases, \
  	news stories would often present the study as evidence that masks are ineffective against Covid-19 or would fail to mention the tenuousness of the evidence and the limitations of the study. \
-  	Content inaccurately depicting the findings received 6.4 times more retweets on Twitter and 3.4 times more interactions on Facebook than accurate content. None of the content we reviewed \
+  	Content inaccurately depicting the findings received {ratio(tweets['stances'], 'retweets'):.1f} times more retweets on Twitter and {ratio(posts['stances'], 'interactions'):.1f} times more interactions on Facebook than accurate content. None of the content we reviewed \
    	received a fact check despite a clarifying statement from Cochrane on March 10, 2023.") 
 	st.subheader("Influential Misinformation Spreaders Operate Across Multiple Platforms")
 	st.write("Some of the same personalities who posted content about the Cochrane review on Substack were also active across multiple social media platforms. For instance, Vinay Prasad was \
  	among several people and entities that posted misleading content about the study across YouTube, Twitter and Facebook.")
 	st.subheader("Substack as an Early Amplifier of Misinterpreted Findings")
-	st.write("The online publishing platform Substack played a large role early on in spreading misleading narratives about the Cochrane study. Over 90 percent of the 28 Substack articles we identified \
+	st.write(f"The online publishing platform Substack played a large role early on in spreading misleading narratives about the Cochrane study. {percent(share(twitter_stories['outlets']['substack'], 'posts'))} of the {total(twitter_stories['outlets']['substack'], 'posts')} Substack articles we identified \
  	inaccurately presented the study findings. The articles were primarily from controversial figures known for spreading misinformation about Covid-19 and public health policy during the pandemic.")
 	st.subheader("Disproportionate Influence of a Few Accounts")
 	st.write("A handful of Twitter and Facebook accounts were responsible for 80 percent of the retweets and interactions, respectively. Misleading content from these accounts moved quicker and \
  	more broadly on social media than did accurate accounts of the study findings.")
 	st.subheader("Stephens’ NYT op-ed a Major Amplifier of False Narratives")
-	st.write("While the ratio of inaccurate to accurate posts was around 5:1 on Twitter before the publication of Bret Stephens' Feb. 21, 2023 New York Times op-ed, his piece resulted in a \
+	st.write(f"While the ratio of inaccurate to accurate posts was around {ratio(tweets['before']['stephens_op_ed'], 'posts'):.0f}:1 on Twitter before the publication of Bret Stephens' Feb. 21, 2023 New York Times op-ed, his piece resulted in a \
  	massive spike in interactions on both Twitter and Facebook, with people sharing or commenting on the story. This news story created the biggest spike of any publication writing about the \
   	cochrane study in our dataset.")
 	st.subheader("Multi-Language Spread of Misinformation on Facebook")
 	st.write("Misleading information about the Cochrane study on Facebook was not confined to English. It spread across multiple languages, including Albanian, Arabic, Bosnian, Finnish, French, \
  	German, Hungarian, Japanese, Korean, Russian and Swedish, underscoring its global reach.")
 	st.subheader("Inaccurate Content on YouTube Gets a Disproportionate Number of Views")
-	st.write("The disparity between content inaccurately reporting on the Cochrane findings and accurate reporting was particularly pronounced on YouTube. Inaccurate videos attracted nearly 38.5 times more views than accurate videos, contributing significantly to the spread \
+	st.write(f"The disparity between content inaccurately reporting on the Cochrane findings and accurate reporting was particularly pronounced on YouTube. Inaccurate videos attracted {ratio(videos['stances'], 'views'):.1f} times more views than accurate videos, contributing significantly to the spread \
  	of misinformation.")
 	st.subheader("Polarized Sharing of News Articles on Twitter")
 	st.write("A clear polarization was identified in the communities sharing links to news stories about the Cochrane study. With minimal crossover between those sharing accurate and misleading \
  	narratives, the data indicates users were mostly exposed to, or chose to consume, a single narrative, with misleading narratives having an outsized impact.")
 
 content_column_4 = st.columns((1, 2, 1))[1]
-with content_column_4:
+with content_column_4, stage('section: twitter'):
 	st.header("Tracking the spread of content related to the Cochrane study on Twitter, Facebook and YouTube")
 	st.write("In the following section, we provide the details of a data analysis that examined the top content — in terms of engagement, such as views, impressions and interactions — on Twitter, \
  	Facebook and YouTube related to the findings of the Cochrane study. In a subsequent section, we will look specifically at the social media engagement generated by online news stories \
@@ -377,22 +268,28 @@ with content_column_4:
   	the more impressions, retweets, interactions or views. The x axis represents the days between January 29 and April 2023, and the y axis is the cumulative amount of engagement. \
    	You can zoom in and out of the scatterplot. If you want to return the scatterplot to its default view, double click on the plot.")
 	st.subheader("Twitter")
-	st.write("1 percent of accounts tweeting about the Cochrane study accounted for 80 percent of retweets, highlighting the disproportionate impact a handful of accounts had on the overall \
+	st.write(f"1 percent of accounts tweeting about the Cochrane study accounted for 80 percent of retweets, highlighting the disproportionate impact a handful of accounts had on the overall \
  	conversation. Among these top tweeters, accounts that distorted, misread or failed to properly frame the study's findings outpaced those that accurately communicated the study results. \
-  	In total, there were 272 tweets from accounts inaccurately portraying the study's results, garnering 158,000 retweets and 32 million impressions, while 89 tweets from accounts accurately \
-   	conveying the findings generated 25,000 retweets and 13 million impressions. In other words, for every accurate tweet, there were three erroneous ones. These misleading tweets had a \
-    	significantly broader reach and attracted more engagement, amassing 6.4 times more retweets and 2.5 times more impressions than their accurate counterparts.") 
+  	In total, there were {tweets['stances']['misleading']['posts']} tweets from accounts inaccurately portraying the study's results, garnering {rounded(tweets['stances']['misleading']['retweets'])} retweets and {rounded(tweets['stances']['misleading']['impressions'])} impressions, while {tweets['stances']['nuanced_accurate']['posts']} tweets from accounts accurately \
+   	conveying the findings generated {rounded(tweets['stances']['nuanced_accurate']['retweets'])} retweets and {rounded(tweets['stances']['nuanced_accurate']['impressions'])} impressions. In other words, for every accurate tweet, there were {ratio(tweets['stances'], 'posts'):.0f} erroneous ones. These misleading tweets had a \
+    	significantly broader reach and attracted more engagement, amassing {ratio(tweets['stances'], 'retweets'):.1f} times more retweets and {ratio(tweets['stances'], 'impressions'):.1f} times more impressions than their accurate counterparts.") 
 	y_axis = st.selectbox("Select the metric you are interested in:", options=["impressions_cumulative", "retweets_cumulative"], key='tweets')
 
-top_tweets = pd.read_csv('99th_percentile_tweets_april27.csv')
+# the indexes behind the date range are built after the introduction has been sent
+window_start, window_end = date_window()
 
-scatter(top_tweets)
+with section("Top tweets") as top_tweets_section:
+	if top_tweets_section.open:
+		top_tweets = windowed('top_tweets', 'twitter', TWEET_CHART_COLUMNS)
+		scatter(top_tweets, 'top tweets')
+		window_caption('top_tweets', 'twitter', TWEET_CHART_COLUMNS)
+explore_concentration('top_tweets', 'twitter', TWEET_CHART_COLUMNS, 'top tweets')
 content_column_5 = st.columns((1, 2, 1))[1]
-with content_column_5:
-	st.write('''Bret Stephens’ February 21, 2023 New York Times op-ed, headlined “The Mask Mandates Did Nothing. Will Any Lessons Be Learned?” created a large jump in engagement \
+with content_column_5, stage('section: twitter op-ed'):
+	st.write(f'''Bret Stephens’ February 21, 2023 New York Times op-ed, headlined “The Mask Mandates Did Nothing. Will Any Lessons Be Learned?” created a large jump in engagement \
  	and amplified the false narrative that masks are ineffective. But even before publication of the piece, content inaccurately interpreting the study was hurtling ahead of accurate \
-  	content on Twitter. Between January 30, 2023, when the Cochrane study was published, and the date of Stephens' piece, the ratio of inaccurate posts to accurate ones was almost 5:1, \
-   	receiving 15 times more retweets and 5.4 times more impressions.''')
+  	content on Twitter. Between January 30, 2023, when the Cochrane study was published, and the date of Stephens' piece, the ratio of inaccurate posts to accurate ones was almost {ratio(tweets['before']['stephens_op_ed'], 'posts'):.0f}:1, \
+   	receiving {ratio(tweets['before']['stephens_op_ed'], 'retweets'):.0f} times more retweets and {ratio(tweets['before']['stephens_op_ed'], 'impressions'):.1f} times more impressions.''')
 	st.write("It’s unclear whether the early surge in engagement from outspoken critics of Covid-19 public policy and masking policy in particular — including Carl Heneghan, Steve Kirsch, \
  	Robert Malone, Michael Senger and Vinay Prasad, all of whom published early articles on Substack — influenced or encouraged right-leaning journalists, including Stephens, \
   	to publish their pieces. Nonetheless, the data suggests they were successful in establishing a leading narrative about the Cochrane study — that masks are ineffective — among certain \
@@ -403,38 +300,37 @@ with content_column_5:
   	populations, potentially influencing their decision making. While vaccine and mask skepticism are different, the two communities have shown [considerable overlap](https://www.sciencedirect.com/science/article/pii/S0264410X23003444) during the \
    	pandemic. It’s possible that flawed interpretations of the Cochrane study may also have influenced those who remain undecided on this issue.")
 	st.subheader("Facebook")
-	st.write("Engagement on Facebook was slightly less concentrated among accounts, with 10 percent of accounts generating 80 percent of the engagement. \
- 	Similar to Twitter, the number of inaccurate posts about the Cochrane study exceeded accurate ones. There were nearly four times as many inaccurate posts (104) than accurate ones \
-  	(27), which resulted in 3.4 times more interactions (41,161 vs. 12,051). It’s important to note that this data was gathered from CrowdTangle and only represents public-facing pages \
+	st.write(f"Engagement on Facebook was slightly less concentrated among accounts, with 10 percent of accounts generating 80 percent of the engagement. \
+ 	Similar to Twitter, the number of inaccurate posts about the Cochrane study exceeded accurate ones. There were {ratio(posts['stances'], 'posts'):.1f} times as many inaccurate posts ({posts['stances']['misleading']['posts']}) than accurate ones \
+  	({posts['stances']['nuanced_accurate']['posts']}), which resulted in {ratio(posts['stances'], 'interactions'):.1f} times more interactions ({posts['stances']['misleading']['interactions']:,} vs. {posts['stances']['nuanced_accurate']['interactions']:,}). It’s important to note that this data was gathered from CrowdTangle and only represents public-facing pages \
    	and groups, which make up a smaller proportion of total content.")
 	
-facebook_top_posts = pd.read_csv('facebook_top_80_cochrane.csv')
-
-scatter_facebook(facebook_top_posts)
+with section("Top Facebook posts") as facebook_section:
+	if facebook_section.open:
+		facebook_top_posts = windowed('facebook_top_posts', 'facebook')
+		show_chart(facebook_chart(facebook_top_posts), 'facebook top posts')
+		window_caption('facebook_top_posts', 'facebook')
+explore_concentration('facebook_top_posts', 'facebook', None, 'facebook top posts')
 content_column_6 = st.columns((1, 2, 1))[1]
-with content_column_6:
+with content_column_6, stage('section: facebook'):
 	st.write("Right-wing news outlets and personalities, such as Fox News, Sean Hannity, Breitbart, the Washington Examiner and the National Review, posted inaccurate information on \
  	both Twitter and Facebook. German accounts pushing out inaccurate information were also found on both platforms. On Facebook, however, posts from German accounts garnered a greater \
   	share of total interactions compared to those accounts on Twitter. Furthermore, inaccurate posts on Facebook were communicated across a broad array of languages, including Albanian, \
    	Arabic, Bosnian, Finnish, French, German, Hungarian, Japanese, Korean, Russian and Swedish. Among the top posts on Twitter, the only other languages identified were Finnish, Japanese \
     	and Portuguese.")
 	st.subheader("YouTube")
-	st.write("The discrepancy between content inaccurately and accurately reporting on the Cochrane findings was most pronounced on YouTube. We identified 47 videos that \
- 	inaccurately represented the findings, compared with 32 videos that accurately covered the study. These inaccurate videos produced 38.5 times more views (2.5 million) than \
-  	accurate videos (67,000).")
+	st.write(f"The discrepancy between content inaccurately and accurately reporting on the Cochrane findings was most pronounced on YouTube. We identified {videos['stances']['misleading']['posts']} videos that \
+ 	inaccurately represented the findings, compared with {videos['stances']['nuanced_accurate']['posts']} videos that accurately covered the study. These inaccurate videos produced {ratio(videos['stances'], 'views'):.1f} times more views ({rounded(videos['stances']['misleading']['views'])}) than \
+  	accurate videos ({rounded(videos['stances']['nuanced_accurate']['views'])}).")
 
-yt = pd.read_csv( 'cochrane_youtube_coded.csv')
-
-# cleaning the csv file
-yt = yt[~yt.stance.isna()]
-yt['day'] = yt.publishedAt.apply(lambda x: pd.to_datetime(x))
-yt = yt[['day','link', 'channelTitle', 'viewCount', 'stance']]
-yt.columns = ['day','link', 'channel_title', 'views', 'stance']
-
-scatter_youtube(yt)
+with section("YouTube videos") as youtube_section:
+	if youtube_section.open:
+		yt = windowed('youtube', 'youtube', YOUTUBE_CHART_COLUMNS)
+		show_chart(youtube_chart(yt), 'youtube')
+		window_caption('youtube', 'youtube', YOUTUBE_CHART_COLUMNS)
 
 content_column_7 = st.columns((1, 2, 1))[1]
-with content_column_7:
+with content_column_7, stage('section: youtube and media'):
 	st.write("The first YouTube video in the dataset, published on February 1, 2023 — shortly after the publication of the Cochrane study — came from Vinay Prasad. [Prasad has been \
  	criticized](https://sciencebasedmedicine.org/vinay-prasad-public-healths-mistruth-problem/) for attacking the trust of public health organizations and making specious claims about masks. The video presented a misleading account of the study’s conclusions. \
   	Prasad was the only personality we found to have posted misleading content about the Cochrane study across YouTube, Twitter and Facebook, and who also wrote misleading articles \
@@ -445,23 +341,27 @@ with content_column_7:
 	st.write("In the following section, we focus exclusively on reporting and news coverage of the Cochrane study, including content from Substack, an online \
  	publishing platform that has become popular in recent years.")
 	st.subheader("Methodology")
-	st.write('''Using the media analytics platform Meltwater (and searching for the combination of *mask* AND *cochrane*) and scraping Altmetric (an analytics platform that tracks /
- 	mentions of academic articles on the web), we gathered 152 news stories and Substack articles published between January 29 and April 1, 2023 addressing the Cochrane study. Of these /
-  	news stories, 70 percent provided an incomplete analysis of the actual findings of the study or misrepresented them altogether. In such cases, news stories would often present the study as /
+	st.write(f'''Using the media analytics platform Meltwater (and searching for the combination of *mask* AND *cochrane*) and scraping Altmetric (an analytics platform that tracks /
+ 	mentions of academic articles on the web), we gathered {total(twitter_stories['stances'], 'posts')} news stories and Substack articles published between January 29 and April 1, 2023 addressing the Cochrane study. Of these /
+  	news stories, {percent(share(twitter_stories['stances'], 'posts'))} provided an incomplete analysis of the actual findings of the study or misrepresented them altogether. In such cases, news stories would often present the study as /
    	evidence that masks are ineffective against Covid-19 or would fail to mention the tenuousness of the evidence and the limitations of the study.''') 
 	st.subheader("Media on Twitter")
-	st.write("Media reports that misinterpreted or misleadingly portrayed the findings of the Cochrane study far outpaced those that accurately depicted the findings. Misleading stories \
-      	received over 30 million impressions on Twitter compared with the nearly 18 million impressions that accurate stories received. The discrepancy was even greater \
-       	for retweets. Misleading stories received nearly 140,000 retweets compared with just over 30,000 retweets received by stories accurately reporting on the study. In effect, \
-	misleading stories gleaned 1.6 times more impressions and four times more retweets than accurate stories.")
+	st.write(f"Media reports that misinterpreted or misleadingly portrayed the findings of the Cochrane study far outpaced those that accurately depicted the findings. Misleading stories \
+      	received {rounded(twitter_stories['stances']['misleading']['impressions'])} impressions on Twitter compared with the {rounded(twitter_stories['stances']['nuanced_accurate']['impressions'])} impressions that accurate stories received. The discrepancy was even greater \
+       	for retweets. Misleading stories received {rounded(twitter_stories['stances']['misleading']['retweets'])} retweets compared with {rounded(twitter_stories['stances']['nuanced_accurate']['retweets'])} retweets received by stories accurately reporting on the study. In effect, \
+	misleading stories gleaned {ratio(twitter_stories['stances'], 'impressions'):.1f} times more impressions and {ratio(twitter_stories['stances'], 'retweets'):.1f} times more retweets than accurate stories.")
 	y_axis = st.selectbox("Select the metric you are interested in:", options=["impressions_cumulative", "retweets_cumulative"], key='news_stories')
 
-news_stories = pd.read_csv("news_stories_final_april26.csv")
-scatter(news_stories)
+with section("News stories on Twitter") as news_section:
+	if news_section.open:
+		news_stories = windowed('news_stories', 'twitter', TWEET_CHART_COLUMNS)
+		scatter(news_stories, 'news stories')
+		window_caption('news_stories', 'twitter', TWEET_CHART_COLUMNS)
 
 content_column_8 = st.columns((1, 2, 1))[1]
-with content_column_8:
-	st.write("Some of the first articles that appeared on Twitter after the Cochrane study came out were published on Substack. Over 90 percent (or 26 of the 28) Substack \
+with content_column_8, stage('section: media on twitter'):
+	substack = twitter_stories['outlets']['substack']
+	st.write(f"Some of the first articles that appeared on Twitter after the Cochrane study came out were published on Substack. {percent(share(substack, 'posts'))} (or {substack['misleading']['posts']} of the {total(substack, 'posts')}) Substack \
  	articles we identified inaccurately presented the study findings. These articles came primarily from the Substacks of Peter McCullough, Steve Kirsch, Robert Malone and Vinay Prasad, \
   	all controversial figures known for spreading misleading information about Covid-19 and public health policy during the pandemic.")
 	st.write('''Right-wing news outlets, such as ZeroHedge, the Washington Free Beacon, the Daily Mail, Reason and Fox News, were also quick to publish misleading accounts based on the study’s \
@@ -494,84 +394,24 @@ def set_page_layout1():
 
 # Call the layout setting function
 set_page_layout1()
-HtmlFile = open('nytimes_graph.html', 'r', encoding='utf-8')
-
-html(HtmlFile.read(), height=900, width=1000)
+with section("Network of accounts tweeting the two op-eds", expanded=False) as nytimes_section:
+	if nytimes_section.open:
+		show_network('nytimes')
+		show_polarization('nytimes')
+		show_account_tweets('nytimes')
 
 content_column_9 = st.columns((1, 2, 1))[1]
-with content_column_9:
+with content_column_9, stage('section: nytimes network'):
 	st.write("The visualization shows two clearly defined communities with very few accounts tweeting both stories, as signified by the nodes connecting the two clusters. \
  	The stark separation of these two communities may be seen as evidence that Tufekci’s op-ed, which dismissed and attempted to debunk claims made by Stephens, had little impact on \
   	the Twitter community supporting Stephens' view.")
-	st.write("We also wanted to understand whether this polarization applied not only to the Times op-eds but to all of the 152 news stories and Substack articles identified on Twitter \
+	st.write(f"We also wanted to understand whether this polarization applied not only to the Times op-eds but to all of the {total(twitter_stories['stances'], 'posts')} news stories and Substack articles identified on Twitter \
  	regarding the Cochrane study. We generated a new network visualization comprising only those tweets that shared links to one or more of these pieces and accounted for 80 percent of \
   	the total retweets within the dataset. This approach was adopted to highlight the most influential nodes and content.")
 	st.write("Green nodes reflect tweets that shared news stories coded as accurate or nuanced, while red nodes reflect tweets that shared news stories coded as misleading. In \
  	this network, we sized the nodes according to the number of links the account shared; the larger the node, the greater the number of links shared. You can zoom in to see the \
   	individual networks and the news stories that they are sharing. You can also click on the nodes to link out to the tweet.")
 
-# load the two dataframes needed for the network viz
-color_code = pd.read_csv('color_code_misleading.csv')
-tweets_stance = pd.read_csv('top_80_percent_full_links_tweets_network_data.csv')
-
-G = nx.DiGraph()
-
-accuracy_ratio_dict = color_code.set_index('username')['accuracy_ratio'].to_dict()
-color_mapping = {"misleading": "#FF7F7F", "nuanced_accurate": "#32CD32", "neutral":"grey"}
-
-links_by_username = defaultdict(set)
-
-# Create dictionaries to store all tweets and cumulative retweets for each username
-tweets_by_username = {}
-retweets_by_username = {}
-
-for index, row in tweets_stance.iterrows():
-	username = row['username']
-	retweets = row['retweets']
-	tweet = row['link']
-	link = row['original_link']
-	
-	links_by_username[username].add(link)
-
-	if username in tweets_by_username:
-		tweets_by_username[username].append(tweet)
-		retweets_by_username[username] += retweets
-	else:
-		tweets_by_username[username] = [tweet]
-		retweets_by_username[username] = retweets
-
-	G.add_node(username)
-	G.add_edge(username, link)
-
-net_2 = Network(height='700px', width='100%', notebook=True, bgcolor='#222222', font_color='white')
-# net.repulsion()
-
-net_2.from_nx(G)
-net_2.barnes_hut(overlap=1)
-net_2.repulsion(node_distance=800, central_gravity=0.01, spring_length=150)
-
-		
-for node in net_2.nodes:
-	username = node['id']
-	unique_links_count = len(links_by_username.get(username, set()))
-	node['size'] = unique_links_count * 30
-	all_tweets = tweets_by_username.get(username, [])
-	formatted_tweets = "<br>".join([f'<a href="{t}" target="_blank">{t}</a>' for t in all_tweets])
-	node['title'] = f"Username: {username}<br>{formatted_tweets}"
-	
-#     # Set the node color based on the accuracy_ratio value
-	accuracy_ratio = accuracy_ratio_dict.get(username)
-	if accuracy_ratio:
-		node['color'] = color_mapping[accuracy_ratio]
-		
-for edge in net_2.edges:
-	source_node_color = net_2.get_node(edge['from']).get('color', '#0000FF')
-	print(edge, source_node_color)
-	edge['color'] = source_node_color
-
-
-net_2.save_graph('full_links_graph.html')
-
 def set_page_layout_2():
     st.markdown(
         """
@@ -588,33 +428,53 @@ def set_page_layout_2():
 set_page_layout_2()
 
 
-HtmlFile2 = open('full_links_graph.html', 'r', encoding='utf-8')
-
-html(HtmlFile2.read(), height=900, width=1000)
+with section("Network of accounts sharing news stories", expanded=False) as full_links_section:
+	if full_links_section.open:
+		show_network('full_links')
+		show_polarization('full_links')
+		show_account_tweets('full_links')
+with st.expander("Rebuild the network for another share of retweets", key='full links concentration', on_change='rerun') as rebuild:
+	if rebuild.open:
+		with stage('section: concentration', dataset='tweets_stance'):
+			coverage = engagement_share('full links')
+			if coverage < 1 and st.toggle("Show the network of the accounts producing this share", key='full links filtered'):
+				show_network('full_links', coverage=coverage)
 
 
 content_column_10 = st.columns((1, 2, 1))[1]
-with content_column_10:
+with content_column_10, stage('section: media on facebook'):
 	st.write("Similar to the previous network, the broader network of Twitter accounts sharing all the news stories covering the Cochrane study was also highly polarized. Clusters of \
  	accounts sharing news stories misrepresenting the Cochrane study are separated from communities sharing accurate ones. The lack of links, or interactions, between the different \
   	clusters suggests that users are largely being exposed to, or are electing to consume, a single narrative about the Cochrane study. Given the outsized impact (in terms of impressions \
    	and retweets) that inaccurate stories had, it appears that Twitter users are consuming a decontextualized and misleading narrative about the efficacy of masks.")
 	st.subheader("Media on Facebook")
-	st.write("Media reporting about the Cochrane study on Facebook was similar to Twitter. There were more than twice as many misleading media stories (81) as accurate media stories (39) \
- 	about the study, and these misleading stories produced three times as many total interactions (43,000) on the platform than those of accurate stories (14,000).")
-
-news_stories_facebook = pd.read_csv('aggregate_facebook.csv')
-
-scatter_facebook(news_stories_facebook)
+	st.write(f"Media reporting about the Cochrane study on Facebook was similar to Twitter. There were {ratio(facebook_stories['stances'], 'posts'):.1f} times as many misleading media stories ({facebook_stories['stances']['misleading']['posts']}) as accurate media stories ({facebook_stories['stances']['nuanced_accurate']['posts']}) \
+ 	about the study, and these misleading stories produced {ratio(facebook_stories['stances'], 'interactions'):.1f} times as many total interactions ({rounded(facebook_stories['stances']['misleading']['interactions'])}) on the platform than those of accurate stories ({rounded(facebook_stories['stances']['nuanced_accurate']['interactions'])}).")
+
+with section("News stories on Facebook") as news_facebook_section:
+	if news_facebook_section.open:
+		news_stories_facebook = windowed('news_stories_facebook', 'facebook')
+		show_chart(facebook_chart(news_stories_facebook), 'news stories facebook')
+		window_caption('news_stories_facebook', 'facebook')
+
+with section("The same stories on Twitter and Facebook", expanded=False) as stories_section:
+	if stories_section.open:
+		with stage('section: stories across platforms'):
+			stories = story_engagement(study)
+			shared = stories[stories['platforms'] > 1].sort_values('interactions', ascending=False)
+			st.caption(f'{len(shared)} of {len(stories)} news stories were shared on both platforms')
+			st.dataframe(shared.drop(columns='platforms'), hide_index=True)
 
 content_column_11 = st.columns((1, 2, 1))[1]
-with content_column_11:
-	st.write("However, whereas Substack articles featured frequently on Twitter, on Facebook they played a smaller role. We identified 28 Substack articles on Twitter, which made up 16 \
- 	percent of all impressions, compared with 14 Substack articles on Facebook, which accounted for 5 percent of all interactions.")
+with content_column_11, stage('section: conclusion'):
+	st.write(f"However, whereas Substack articles featured frequently on Twitter, on Facebook they played a smaller role. We identified {total(twitter_stories['outlets']['substack'], 'posts')} Substack articles on Twitter, which made up \
+ 	{percent(total(twitter_stories['outlets']['substack'], 'impressions') / total(twitter_stories['stances'], 'impressions'))} of all impressions, compared with {total(facebook_stories['outlets']['substack'], 'posts')} Substack articles on Facebook, which accounted for \
+ 	{percent(total(facebook_stories['outlets']['substack'], 'interactions') / total(facebook_stories['stances'], 'interactions'))} of all interactions.")
 	st.header("Conclusion")
 	st.write("This case study underscores how easily scientific research can be misconstrued and exploited to fit particular narratives, especially when amplified by prominent \
  	figures and media entities. Inaccurate portrayals of the study outpaced and outnumbered accurate accounts and amassed significantly more engagement across Twitter, Facebook and YouTube.")
 	st.write("As digital platforms continue to serve as key sources of information, addressing these dynamics remains crucial. Social media’s role in interpreting and communicating scientific \
  	findings will continue to affect public discourse and consensus building around policy. As such, this analysis provides an urgent reminder of the challenges inherent in disseminating \
   	research on platforms where contextualization and attention to detail will invariably come second to catchy headlines and ideology. ")
-	
+
+show_timings()
@@ -0,0 +1,118 @@
+import os
+import threading
+from contextlib import contextmanager
+
+
+STUDIES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_STUDY = 'cochrane_masks'
+
+# study -> data directory (relative to the repo), csv file of every dataset it has, first day of the
+# timelines, charted stances with their labels (codes from the shared codebook), platforms and networks,
+# the events the narrative compares before and after, and outlets counted by the domain of their links
+STUDIES = {
+	'cochrane_masks': {
+		'title': 'Masking the Truth: How a Cochrane Study Got Entangled in a Web of Misinterpretation',
+		'data_dir': '',
+		'datasets': {
+			'top_tweets': '99th_percentile_tweets_april27.csv',
+			'facebook_top_posts': 'facebook_top_80_cochrane.csv',
+			'youtube': 'cochrane_youtube_coded.csv',
+			'news_stories': 'news_stories_final_april26.csv',
+			'color_code': 'color_code_misleading.csv',
+			'tweets_stance': 'top_80_percent_full_links_tweets_network_data.csv',
+			'news_stories_facebook': 'aggregate_facebook.csv',
+			'nyt': 'nytimes_articles.csv',
+		},
+		'start': '2023-01-29',
+		'stances': {'nuanced_accurate': 'Accurate', 'misleading': 'Misleading'},
+		'platforms': ['twitter', 'facebook', 'youtube'],
+		'networks': ['nytimes', 'full_links'],
+		'events': {'stephens_op_ed': '2023-02-21', 'cochrane_statement': '2023-03-10'},
+		'outlets': {'substack': 'substack.com'},
+	},
+}
+
+# colours of the shared stance codebook, used by the charts and the networks
+STANCE_COLORS = {"misleading": "#FF7F7F", "nuanced_accurate": "#32CD32", "neutral": "grey"}
+
+# entries kept by each in-process cache, shared by every study served by the worker
+CACHE_LIMITS = {
+	'frames': 64,
+	'timelines': 64,
+	'concentrations': 64,
+	'indexes': 64,
+	'tables': 16,
+	'links': 16,
+	'stats': 16,
+	'polarization': 16,
+	'graphs': 8,
+	'pages': 8,
+}
+
+
+def study_config(study):
+	if study not in STUDIES:
+		raise KeyError(f'unknown study: {study}')
+	return STUDIES[study]
+
+
+def study_dir(study):
+	return os.path.join(STUDIES_DIR, study_config(study)['data_dir'])
+
+
+def lru_get(cache, key):
+	# cache is an OrderedDict, a hit becomes the most recently used entry
+	value = cache.get(key)
+	if value is not None:
+		cache.move_to_end(key)
+	return value
+
+
+def lru_put(cache, key, value, limit):
+	cache[key] = value
+	cache.move_to_end(key)
+	while len(cache) > CACHE_LIMITS[limit]:
+		cache.popitem(last=False)
+
+
+@contextmanager
+def key_lock(locks, key, lock):
+	# the lock of the callers building key, looked up under the cache's lock: a build holds up
+	# the other callers of its key only, not the hits and builds of the others. locks maps key
+	# -> [lock, callers] and the entry goes with its last caller, so only keys in use are kept
+	with lock:
+		entry = locks.setdefault(key, [threading.Lock(), 0])
+		entry[1] += 1
+	try:
+		with entry[0]:
+			yield
+	finally:
+		with lock:
+			entry[1] -= 1
+			if not entry[1]:
+				del locks[key]
+
+
+def cached_build(cache, locks, lock, key, version, build, limit, extend=None):
+	# the value of key for this version of its inputs, looked up under the cache's lock and
+	# built outside it, under the lock of key only; cache holds key -> (version, value). a value
+	# of another version is passed to extend(version, value) first, which returns None if it can't
+	with lock:
+		cached = lru_get(cache, key)
+	if cached is not None and cached[0] == version:
+		return cached[1]
+
+	with key_lock(locks, key, lock):
+		with lock:
+			cached = lru_get(cache, key)
+		if cached is not None and cached[0] == version:
+			return cached[1]
+
+		value = None if cached is None or extend is None else extend(*cached)
+		if value is None:
+			value = build()
+		with lock:
+			lru_put(cache, key, (version, value), limit)
+		return value
+
@@ -0,0 +1,25 @@
+import itertools
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from studies import DEFAULT_STUDY, STUDIES, study_dir
+
+
+_studies = itertools.count()
+
+
+@pytest.fixture
+def study(tmp_path, monkeypatch):
+	# a copy of the datasets of the default study in tmp_path, under a name of its own so no
+	# cached frame, key set or timeline is shared with another test or the real data
+	config = STUDIES[DEFAULT_STUDY]
+	for filename in config['datasets'].values():
+		shutil.copy(os.path.join(study_dir(DEFAULT_STUDY), filename), tmp_path)
+	name = f'test_{next(_studies)}'
+	monkeypatch.setitem(STUDIES, name, dict(config, data_dir=str(tmp_path)))
+	return name
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+import collectors
+from collectors import collect, collect_dataset
+from data_loader import _file_hash, clear_cache, dataset_hash, dataset_path, load_dataset
+from studies import DEFAULT_STUDY
+
+
+FAST = {'backoff': 0, 'timeout': 5}
+
+
+def write_pages(folder, pages):
+	folder.mkdir(parents=True)
+	for number, page in enumerate(pages):
+		page.to_json(folder / f'{number:03}.jsonl', orient='records', lines=True, date_format='iso')
+
+
+def test_fixture_collection(study, tmp_path):
+	# every page refreshes the retweets of three known posts and carries a new one, which the
+	# next page repeats; the pages are fetched in order, two of them per batch
+	tweets = load_dataset('top_tweets', study=study)
+	pages = []
+	for number in range(6):
+		page = tweets.iloc[3 * number:3 * number + 4].assign(retweets=1000 + number)
+		page.iloc[3, page.columns.get_loc('tweet_id')] = f'new-{number // 2}'
+		pages.append(page)
+	write_pages(tmp_path / 'fixtures' / 'top_tweets', pages)
+
+	totals = collect_dataset('top_tweets', study=study, settings=dict(FAST, concurrency=1, batch_size=5), fixtures=str(tmp_path / 'fixtures'))
+	assert totals == {'pages': 6, 'rows': 24, 'updated': 18, 'added': 3}
+
+	clear_cache()
+	collected = load_dataset('top_tweets', study=study)
+	assert len(collected) == len(tweets) + 3
+	# the export has ids mangled by a spreadsheet into duplicates, the collection adds none
+	assert collected['tweet_id'].duplicated().sum() == tweets['tweet_id'].duplicated().sum()
+	assert collected['retweets'].iloc[:18].tolist() == [1000 + number for number in range(6) for _ in range(3)]
+	assert collected['tweet_id'].iloc[-3:].tolist() == ['new-0', 'new-1', 'new-2']
+	assert dataset_hash('top_tweets', study) == _file_hash(dataset_path('top_tweets', study))[0].hexdigest()
+
+	# collected again, nothing is new and the same posts are refreshed
+	totals = collect_dataset('top_tweets', study=study, settings=FAST, fixtures=str(tmp_path / 'fixtures'))
+	assert totals['added'] == 0
+	assert len(load_dataset('top_tweets', study=study)) == len(tweets) + 3
+
+
+def test_failed_writer_stops_collection(study, tmp_path, monkeypatch):
+	tweets = load_dataset('top_tweets', study=study)
+	write_pages(tmp_path / 'fixtures' / 'top_tweets', [tweets.iloc[[number]] for number in range(40)])
+
+	def full_disk(*args):
+		raise OSError('no space left on device')
+
+	monkeypatch.setattr(collectors, 'ingest_batch', full_disk)
+	settings = dict(FAST, concurrency=2, batch_size=1)
+	with pytest.raises(OSError, match='no space left'):
+		asyncio.run(asyncio.wait_for(collect('top_tweets', study=study, settings=settings, fixtures=str(tmp_path / 'fixtures')), 10))
+
+
+def test_failed_page_stops_collection(study, tmp_path, monkeypatch):
+	tweets = load_dataset('top_tweets', study=study)
+	write_pages(tmp_path / 'fixtures' / 'top_tweets', [tweets.iloc[[number]] for number in range(10)])
+	calls = []
+
+	async def corrupt(session, page, name, options):
+		calls.append(page)
+		raise ValueError('corrupt export')
+
+	monkeypatch.setitem(collectors.ADAPTERS['fixture'], 'fetch', corrupt)
+	with pytest.raises(ValueError, match='corrupt export'):
+		collect_dataset('top_tweets', study=study, settings=dict(FAST, concurrency=1), fixtures=str(tmp_path / 'fixtures'))
+	# neither retried, only network errors and 429 or 5xx responses are, nor followed by the other pages
+	assert len(calls) == 1
+
+
+async def stand_in(handler, run):
+	# a local server in place of the youtube api for the duration of run(url)
+	web = pytest.importorskip('aiohttp.web')
+	app = web.Application()
+	app.router.add_get('/videos', handler)
+	runner = web.AppRunner(app)
+	await runner.setup()
+	site = web.TCPSite(runner, '127.0.0.1', 0)
+	await site.start()
+	try:
+		return await run(f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/videos')
+	finally:
+		await runner.cleanup()
+
+
+def test_youtube_collection(study):
+	web = pytest.importorskip('aiohttp.web')
+	requests = []
+
+	async def videos(request):
+		requests.append(request.query)
+		# the first request of every page is throttled, and retried
+		if sum(query['id'] == request.query['id'] for query in requests) == 1:
+			return web.Response(status=503)
+		ids = request.query['id'].split(',')
+		return web.json_response({'items': [{'id': video, 'statistics': {'viewCount': '7', 'commentCount': '3'} if number % 2 else {'viewCount': '11'}} for number, video in enumerate(ids)]})
+
+	videos_before = load_dataset('youtube', study=study)
+	totals = asyncio.run(stand_in(videos, lambda url: collect('youtube', 'youtube', study, FAST, url=url, api_key='key')))
+
+	ids = videos_before['videoId'].dropna().unique()
+	pages = -(-len(ids) // collectors.YOUTUBE_PAGE)
+	assert totals == {'pages': pages, 'rows': len(ids), 'updated': len(ids), 'added': 0}
+	assert len(requests) == 2 * pages
+	assert all(query['key'] == 'key' and len(query['id'].split(',')) <= collectors.YOUTUBE_PAGE for query in requests)
+
+	clear_cache()
+	refreshed = load_dataset('youtube', study=study).drop_duplicates('videoId').set_index('videoId').loc[ids]
+	assert set(refreshed['viewCount']) == {7, 11}
+	# comments disabled, the count is missing rather than zero
+	assert refreshed.loc[refreshed['viewCount'] == 11, 'commentCount'].isna().all()
+	assert len(load_dataset('youtube', study=study)) == len(videos_before)
+
+
+def test_youtube_client_error_is_not_retried(study):
+	web = pytest.importorskip('aiohttp.web')
+	aiohttp = pytest.importorskip('aiohttp')
+	requests = []
+
+	async def forbidden(request):
+		requests.append(request.query)
+		return web.Response(status=403)
+
+	settings = dict(FAST, concurrency=1)
+	with pytest.raises(aiohttp.ClientResponseError) as error:
+		asyncio.run(stand_in(forbidden, lambda url: collect('youtube', 'youtube', study, settings, url=url, api_key='key')))
+	assert error.value.status == 403
+	assert len(requests) == 1
+	with open(dataset_path('youtube', study), 'rb') as collected, open(dataset_path('youtube', DEFAULT_STUDY), 'rb') as original:
+		assert collected.read() == original.read()
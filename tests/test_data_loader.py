@@ -0,0 +1,50 @@
+import pandas as pd
+
+import data_loader
+from data_loader import clear_cache, dataset_path, load_dataset
+from networks import build_share_graph, share_graph
+from timeline import dataset_timeline, stance_timeline, study_platform
+
+
+def append_text(name, study, rows):
+	# what a collector in another process does: rows written to the end of the csv, unknown to this one
+	path = dataset_path(name, study)
+	with open(path, 'rb') as f:
+		terminated = f.read().endswith(b'\n')
+	with open(path, 'a', encoding='utf-8', newline='') as f:
+		f.write(('' if terminated else '\n') + rows.to_csv(header=False, index=False, lineterminator='\n'))
+
+
+def later_rows(name, study, day=None):
+	rows = pd.read_csv(dataset_path(name, study), dtype=str, keep_default_na=False).tail(5)
+	return rows if day is None else rows.assign(day=day)
+
+
+def test_appends_of_other_processes_extend_the_cache(study, monkeypatch):
+	# the export does not end a line, so its first append is hashed and built again, the ones after
+	# it only parse and add the appended rows
+	append_text('top_tweets', study, later_rows('top_tweets', study, '2023-05-01 00:00:00+00:00'))
+	dataset_timeline('top_tweets', 'twitter', study=study)
+	graph = share_graph('tweets_stance', 'link', True, study)
+	frame = load_dataset('top_tweets', study=study)
+
+	reads = []
+	read_dataset = data_loader.read_dataset
+	monkeypatch.setattr(data_loader, 'read_dataset', lambda path, *args: reads.append(path) or read_dataset(path, *args))
+	append_text('top_tweets', study, later_rows('top_tweets', study, '2023-05-02 12:00:00+00:00'))
+	append_text('tweets_stance', study, later_rows('tweets_stance', study).assign(username='newcomer'))
+
+	extended = dataset_timeline('top_tweets', 'twitter', study=study)
+	extended_graph = share_graph('tweets_stance', 'link', True, study)
+	assert len(load_dataset('top_tweets', study=study)) == len(frame) + 5
+	# only the appended bytes were parsed, no csv was read whole
+	assert reads and not [path for path in reads if isinstance(path, str)]
+	assert extended_graph is not graph
+
+	# the same as parsing and building from the whole history
+	clear_cache()
+	pd.testing.assert_frame_equal(extended, stance_timeline(load_dataset('top_tweets', study=study), study_platform(study, 'twitter')))
+	G, users, shared_links = build_share_graph(load_dataset('tweets_stance', study=study), 'link', True, study)
+	assert set(extended_graph[0].edges) == set(G.edges)
+	pd.testing.assert_frame_equal(extended_graph[1].drop(columns='tweets').sort_index(), users.drop(columns='tweets').sort_index())
+	pd.testing.assert_frame_equal(extended_graph[2].sort_index(), shared_links.sort_index())
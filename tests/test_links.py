@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from links import canonical_links, link_index, story_engagement
+from studies import STUDIES
+
+
+def test_canonical_links():
+	links = pd.Series([
+		'https://www.nytimes.com/2023/02/21/opinion/masks.html?smid=tw-share&utm_source=twitter#comments',
+		'http://m.nytimes.com/2023/02/21/opinion/masks.html/',
+		'https://example.com/search?s=masks&page=2',
+		'https://www.youtube.com/watch?v=abc&t=30',
+		'https://example.com/story?ref_src=twsrc&fbclid=xyz',
+	])
+	assert canonical_links(links).tolist() == [
+		'nytimes.com/2023/02/21/opinion/masks.html',
+		'nytimes.com/2023/02/21/opinion/masks.html',
+		'example.com/search?s=masks&page=2',
+		'youtube.com/watch?v=abc&t=30',
+		'example.com/story',
+	]
+
+
+def test_blank_links_are_no_story():
+	posts = pd.DataFrame({'link': ['', '  ', None, np.nan, 'https://example.com/a'], 'stance': 'misleading', 'retweets': [1, 2, 3, 4, 5]})
+	assert canonical_links(posts['link']).tolist() == [None, None, None, None, 'example.com/a']
+	index = link_index(posts, 'link', ['retweets'])
+	assert index['link'].tolist() == ['example.com/a']
+	assert index['retweets'].tolist() == [5]
+
+
+def test_study_without_story_sources(study, monkeypatch):
+	datasets = {name: filename for name, filename in STUDIES[study]['datasets'].items() if name not in ('news_stories', 'news_stories_facebook')}
+	monkeypatch.setitem(STUDIES, study, dict(STUDIES[study], datasets=datasets))
+	stories = story_engagement(study)
+	assert stories.empty
+	assert list(stories.columns) == ['link', 'stance', 'platforms']
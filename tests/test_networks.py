@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+import networks
+from data_loader import load_dataset
+from networks import DEFAULT_LAYOUT, NETWORK_STYLES, build_share_graph, create_links_network
+from studies import STANCE_COLORS
+
+
+def test_links_network_without_accuracy_codes(study, monkeypatch):
+	# an empty vocabulary gives no codes at all, every node keeps the default colour
+	monkeypatch.setattr(networks, 'code_lookup', lambda *args: np.empty(0, dtype=np.int8))
+	graph = build_share_graph(load_dataset('tweets_stance', study=study), tweet_column='link', directed=True, study=study)
+	color_code = pd.DataFrame({'username': [], 'accuracy_ratio': []})
+	net = create_links_network(None, color_code, NETWORK_STYLES['full_links'], graph, study)
+	assert net.nodes
+	assert not {node.get('color') for node in net.nodes} & set(STANCE_COLORS.values())
+
+
+def test_large_pages_are_laid_out_in_python(study, tmp_path, monkeypatch):
+	# 900 accounts sharing two of 600 links each: above the layout threshold, within the page budget
+	monkeypatch.setattr(networks, 'CACHE_DIR', str(tmp_path / 'graph_cache'))
+	rng = np.random.default_rng(0)
+	users = np.repeat([f'user{number}' for number in range(900)], 2)
+	links = np.stack([rng.choice(600, 2, replace=False) for _ in range(900)]).ravel()
+	tweets = pd.DataFrame({'username': users, 'original_link': [f'https://example.com/{link}' for link in links], 'link': [f'https://twitter.com/{user}/status/{number}' for number, user in enumerate(users)], 'retweets': 1})
+	graph = build_share_graph(tweets, tweet_column='link', directed=True, study=study)
+	# a couple of iterations are enough to tell the positions come from python
+	style = dict(NETWORK_STYLES['full_links'], layout=dict(DEFAULT_LAYOUT, iterations=2))
+	assert DEFAULT_LAYOUT['threshold'] < graph[0].number_of_nodes() <= style['max_nodes']
+
+	net = create_links_network(None, load_dataset('color_code', study=study), style, graph, study)
+	assert len(net.nodes) == graph[0].number_of_nodes()
+	assert all('x' in node and 'y' in node for node in net.nodes)
+	assert not net.options.physics.enabled
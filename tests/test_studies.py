@@ -0,0 +1,31 @@
+import threading
+from collections import OrderedDict
+
+from studies import cached_build
+
+
+def test_builds_hold_up_their_key_only():
+	cache, locks, lock = OrderedDict(), {}, threading.Lock()
+	started, release = threading.Event(), threading.Event()
+
+	def slow():
+		started.set()
+		release.wait(5)
+		return 'a'
+
+	builder = threading.Thread(target=cached_build, args=(cache, locks, lock, 'a', 1, slow, 'frames'))
+	builder.start()
+	assert started.wait(5)
+	# another key is built and served while the first build is running
+	assert cached_build(cache, locks, lock, 'b', 1, lambda: 'b', 'frames') == 'b'
+	assert list(locks) == ['a']
+	release.set()
+	builder.join(5)
+
+	assert cached_build(cache, locks, lock, 'a', 1, lambda: 'rebuilt', 'frames') == 'a'
+	# a value of the previous version is extended, one that can't be is built again
+	extend = lambda version, value: value + '+' if version == 1 else None
+	assert cached_build(cache, locks, lock, 'a', 2, lambda: 'rebuilt', 'frames', extend) == 'a+'
+	assert cached_build(cache, locks, lock, 'a', 3, lambda: 'rebuilt', 'frames', extend) == 'rebuilt'
+	# the lock of a key goes with the last of its callers
+	assert locks == {}
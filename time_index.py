@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from data_loader import dataset_hash
+from studies import DEFAULT_STUDY, cached_build, study_config
+from timeline import PLATFORMS, dataset_timeline
+
+
+# (study, dataset name, platform, columns) -> (content hash, time index)
+_indexes = OrderedDict()
+# key -> [lock, callers] of the builds in progress, see key_lock
+_building = {}
+_lock = threading.Lock()
+
+
+def build_time_index(timeline, metrics):
+	# per stance: the sorted days and prefix sums of every metric, with a leading zero so the
+	# total of any window is one subtraction; plus the stance code of every timeline row
+	codes, stances = pd.factorize(timeline['stance'])
+	days = timeline['day'].to_numpy()
+	index = {'stances': list(stances), 'codes': codes, 'metrics': list(metrics), 'by_stance': {}}
+	for code, stance in enumerate(stances):
+		rows = np.flatnonzero(codes == code)
+		entry = {'days': days[rows]}
+		for metric in metrics:
+			entry[metric] = np.concatenate([[0], np.cumsum(timeline[metric].to_numpy()[rows])])
+		index['by_stance'][stance] = entry
+	return index
+
+
+def _bounds(days, start, end):
+	# rows with start <= day < end, either bound may be None
+	lo = 0 if start is None else int(np.searchsorted(days, np.datetime64(start), side='left'))
+	hi = len(days) if end is None else int(np.searchsorted(days, np.datetime64(end), side='left'))
+	return lo, max(lo, hi)
+
+
+def window_totals(index, start=None, end=None):
+	# stance -> posts and the sum of every metric between start and end
+	totals = {}
+	for stance, entry in index['by_stance'].items():
+		lo, hi = _bounds(entry['days'], start, end)
+		totals[stance] = {'posts': hi - lo}
+		for metric in index['metrics']:
+			totals[stance][metric] = entry[metric][hi] - entry[metric][lo]
+	return totals
+
+
+def window_ratios(totals, numerator='misleading', denominator='nuanced_accurate'):
+	# misleading to accurate ratio of the post count and of every metric
+	top = totals.get(numerator, {})
+	bottom = totals.get(denominator, {})
+	return {key: top[key] / bottom[key] if bottom.get(key) else None for key in top}
+
+
+def window_timeline(timeline, index, start=None, end=None):
+	# the chart rows of the window, with cumulative values restarting at its first day;
+	# the timeline must be the one the index was built from
+	lo, hi = _bounds(timeline['day'].to_numpy(), start, end)
+	if lo == 0 and hi == len(timeline):
+		return timeline
+
+	window = timeline.iloc[lo:hi]
+	codes = index['codes'][lo:hi]
+	before = [_bounds(index['by_stance'][stance]['days'], start, None)[0] for stance in index['stances']]
+
+	# one subtraction per column, the offset of each row looked up by its stance code
+	columns = {}
+	for metric in index['metrics']:
+		column = f'{metric}_cumulative'
+		if column in window.columns:
+			offsets = np.array([index['by_stance'][stance][metric][position] for stance, position in zip(index['stances'], before)])
+			columns[column] = window[column].to_numpy() - offsets[codes]
+	return window.assign(**columns)
+
+
+def dataset_time_index(name, platform, columns=None, study=DEFAULT_STUDY):
+	key = (study, name, platform, None if columns is None else tuple(columns))
+	digest = dataset_hash(name, study)
+	build = lambda: build_time_index(dataset_timeline(name, platform, columns, study), PLATFORMS[platform]['metrics'])
+	return cached_build(_indexes, _building, _lock, key, digest, build, 'indexes')
+
+
+def day_range(study=DEFAULT_STUDY, charts=()):
+	# first and last day of the given (dataset, platform, columns) charts, for the date control
+	first = pd.Timestamp(study_config(study)['start'])
+	last = first
+	for name, platform, columns in charts:
+		for entry in dataset_time_index(name, platform, columns, study)['by_stance'].values():
+			if len(entry['days']):
+				last = max(last, pd.Timestamp(entry['days'][-1]))
+	return first, last
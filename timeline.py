@@ -0,0 +1,181 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from data_loader import appended_rows, dataset_hash, load_dataset, table_frame
+from instrumentation import timed
+from store import store_table
+from studies import DEFAULT_STUDY, cached_build, study_config
+
+
+STANCE_LABELS = {'nuanced_accurate': 'Accurate', 'misleading': 'Misleading', 'neutral': 'Neutral'}
+
+# platform -> engagement columns that get a cumulative series, stances charted and first day
+PLATFORMS = {
+	'twitter': {
+		'metrics': ['retweets', 'impressions'],
+		'stances': ['nuanced_accurate', 'misleading'],
+		'start': '2023-01-29',
+		# rows with a note were flagged as not relevant by the coders
+		'exclude_notes': True,
+	},
+	'facebook': {
+		'metrics': ['interactions'],
+		'stances': ['nuanced_accurate', 'misleading'],
+		'start': '2023-01-29',
+		'exclude_notes': False,
+	},
+	'youtube': {
+		'metrics': ['views'],
+		'stances': ['nuanced_accurate', 'misleading'],
+		'start': '2023-01-29',
+		'exclude_notes': False,
+	},
+}
+
+
+def platform_spec(platform):
+	return PLATFORMS[platform] if isinstance(platform, str) else platform
+
+
+def study_platform(study, platform):
+	# the platform's metrics with the first day and charted stances of the study
+	config = study_config(study)
+	return dict(PLATFORMS[platform], start=config['start'], stances=list(config['stances']), labels=config['stances'])
+
+
+@timed()
+def stance_timeline(df, platform):
+	spec = platform_spec(platform)
+	metrics = spec['metrics']
+
+	mask = (df['day'] >= pd.Timestamp(spec['start'])) & df['stance'].isin(spec['stances'])
+	if spec['exclude_notes']:
+		mask &= df['notes'].isna()
+
+	# one stable sort and one grouped cumsum for every stance and metric
+	timeline = df[mask].sort_values('day', kind='stable')
+	cumulative = timeline.groupby('stance', observed=True)[metrics].cumsum()
+	for metric in metrics:
+		timeline[f'{metric}_cumulative'] = cumulative[metric]
+
+	timeline['label'] = timeline['stance'].map(spec.get('labels', STANCE_LABELS)).astype(str)
+	return timeline.reset_index(drop=True)
+
+
+def youtube_posts(yt):
+	# cleaning the csv file
+	yt = yt[~yt.stance.isna()]
+	yt = yt.rename(columns={'publishedAt': 'day'})
+	yt = yt[['day', 'link', 'channelTitle', 'viewCount', 'stance']]
+	yt.columns = ['day', 'link', 'channel_title', 'views', 'stance']
+	return yt
+
+
+# platform -> function turning a loaded export into posts with a day and the platform's metrics
+PREPARE = {'youtube': youtube_posts}
+
+# (study, dataset name, platform, columns) -> (content hash, (timeline, last row of every stance))
+_timelines = OrderedDict()
+# key -> [lock, callers] of the builds in progress, see key_lock
+_building = {}
+_lock = threading.Lock()
+
+
+def timeline_name(name, platform, columns=None):
+	# file name of a chart timeline in the artifact store
+	suffix = '' if columns is None else '.' + hashlib.sha256('\x1f'.join(columns).encode('utf-8')).hexdigest()[:8]
+	return f'{name}.{platform}{suffix}'
+
+
+def timeline_key(digest, spec, columns=None):
+	# a published timeline is valid for the dataset content and the study's first day, stances and labels
+	payload = {'dataset': digest, 'platform': spec, 'columns': None if columns is None else list(columns)}
+	return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _last_rows(timeline):
+	return timeline.groupby('stance', observed=True).tail(1).set_index('stance')
+
+
+def extend_timeline(timeline, last, rows, platform):
+	# appends the series of the new rows, offset by the last cumulative value of each stance;
+	# returns None when a row is older than the stored series and it has to be recomputed
+	spec = platform_spec(platform)
+	added = stance_timeline(rows, spec)
+	if added.empty:
+		return timeline, last
+	if timeline.empty:
+		return added, _last_rows(added)
+	if added['day'].iloc[0] < timeline['day'].iloc[-1]:
+		return None
+
+	for metric in spec['metrics']:
+		offset = added['stance'].astype(object).map(last[f'{metric}_cumulative'].to_dict()).fillna(0)
+		added[f'{metric}_cumulative'] = (added[f'{metric}_cumulative'] + offset).astype(timeline[f'{metric}_cumulative'].dtype)
+
+	extended = pd.concat([timeline, added], ignore_index=True)
+	last = pd.concat([last, _last_rows(added)])
+	return extended, last[~last.index.duplicated(keep='last')]
+
+
+def dataset_timeline(name, platform, columns=None, study=DEFAULT_STUDY):
+	# the returned frame is shared, callers must not modify it in place
+	key = (study, name, platform, None if columns is None else tuple(columns))
+	digest = dataset_hash(name, study)
+	spec = study_platform(study, platform)
+
+	def extend(previous, cached):
+		# a timeline of the content before an append gets the series of the appended rows
+		rows = appended_rows(name, previous, digest, study)
+		if rows is None:
+			return None
+		rows = rows if columns is None else rows[list(columns)]
+		return extend_timeline(*cached, PREPARE[platform](rows) if platform in PREPARE else rows, spec)
+
+	def build():
+		# published by the pipeline, otherwise computed from the posts
+		table = store_table(timeline_name(name, platform, columns), timeline_key(digest, spec, columns), study, 'timelines')
+		if table is not None:
+			timeline = table_frame(table)
+		else:
+			df = load_dataset(name, columns, study)
+			if platform in PREPARE:
+				df = PREPARE[platform](df)
+			timeline = stance_timeline(df, spec)
+		return timeline, _last_rows(timeline)
+
+	return cached_build(_timelines, _building, _lock, key, digest, build, 'timelines', extend)[0]
+
+
+# candidate bucket widths, the finest one that fits the bucket budget is used
+BUCKET_SIZES = [pd.Timedelta(hours=1), pd.Timedelta(hours=6), pd.Timedelta(days=1), pd.Timedelta(days=7), pd.Timedelta(days=30)]
+
+
+def bucket_size(days, max_buckets=200):
+	span = days.max() - days.min()
+	for size in BUCKET_SIZES:
+		if span / size <= max_buckets:
+			return size
+	return BUCKET_SIZES[-1]
+
+
+def downsample_timeline(timeline, size_metric, max_buckets=200, top_n=5):
+	# keeps the top_n posts of every time bucket and stance as points,
+	# plus one cumulative value per bucket and stance for the line
+	bucketed = timeline.assign(bucket=timeline['day'].dt.floor(bucket_size(timeline['day'], max_buckets)))
+	cumulative_columns = [column for column in timeline.columns if column.endswith('_cumulative')]
+
+	grouped = bucketed.groupby(['label', 'bucket'], sort=True)
+	line = grouped[cumulative_columns].last()
+	line['posts'] = grouped.size()
+	line = line.reset_index().rename(columns={'bucket': 'day'})
+
+	ranked = bucketed.sort_values(size_metric, ascending=False, kind='stable')
+	points = ranked[ranked.groupby(['label', 'bucket']).cumcount() < top_n]
+	points = points.drop(columns='bucket').sort_values('day', kind='stable')
+
+	return points, line